@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Offline detection over recorded footage, using every core
+
+Walks the given files and directories for videos and images, decodes and
+detects them in a pool of worker processes (videos are split into frame
+ranges so one long file still uses every core; each worker loads the model
+once) and appends one CSV row per detection:
+
+    # Re-score a season of trap footage with a new model
+    WEEVIL_MODEL=models/weevil-v2.onnx python analyze.py footage/ -o season-v2.csv
+
+    # Every 5th frame, 8 workers, tiled inference for small insects
+    WEEVIL_TILING=1 python analyze.py footage/ -o quick.csv --stride 5 --workers 8
+
+A checkpoint next to the output records the settings of the run and every
+finished frame range with the CSV size after it, so an interrupted run
+continues where it stopped when the same command is started again; rows of
+a range that was cut off are truncated first. A rerun with a different
+model, detector, tracking or stride setting is refused instead of skipping
+everything as done. Detector settings come from config.py, as for the server.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from itertools import count
+import multiprocessing as mp
+import cv2
+import config
+from detectors import WeevileDetector, create_backend
+from tracker import Tracker
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov', '.m4v', '.mjpeg', '.mjpg')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+COLUMNS = ['file', 'frame', 'time_s', 'track_id', 'class_id', 'score', 'x1', 'y1', 'x2', 'y2']
+
+_detector = None  # Loaded once per worker process by _init_worker
+
+def _init_worker(backend_args):
+    global _detector
+    cv2.setNumThreads(1)  # Parallelism comes from the processes
+    _detector = WeevileDetector(create_backend(*backend_args)).load()
+
+def analyze_range(task):
+    """
+    Worker: detect on one frame range of a video, or on an image
+    Args:
+        task: (path, start, end, stride, batch_size, tracking) where end is
+            None for "to the end of the file" and tracking holds Tracker
+            arguments (None = off)
+    Returns (path, start, frames analyzed, rows, unique weevils, error)
+    
+    Track ids restart in every range, so they are written as
+    "<start>-<id>" to stay unique within the file.
+    """
+    path, start, end, stride, batch_size, tracking = task
+    tracker = Tracker(**tracking) if tracking is not None else None
+    if tracker is not None:
+        tracker.ids = (f"{start}-{i}" for i in count(1))
+    rows = []
+    frames_done = 0
+    
+    try:
+        if path.lower().endswith(IMAGE_EXTENSIONS):
+            frame = cv2.imread(path, cv2.IMREAD_COLOR)
+            if frame is None:
+                raise ValueError("unreadable image")
+            sources = iter([(0, 0.0, frame)])
+        else:
+            sources = read_video(path, stride, start, end)
+        
+        batch = []
+        for index, seconds, frame in sources:
+            batch.append((index, seconds, frame))
+            if len(batch) < batch_size:
+                continue
+            frames_done += detect(batch, tracker, path, rows)
+            batch = []
+        if batch:
+            frames_done += detect(batch, tracker, path, rows)
+    except Exception as e:
+        return path, start, frames_done, rows, 0, str(e)
+    return path, start, frames_done, rows, tracker.unique_count if tracker else None, None
+
+def frame_count(path):
+    """Frames in a video as reported by its container (0 when unknown)"""
+    cap = cv2.VideoCapture(path)
+    try:
+        return max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+    finally:
+        cap.release()
+
+def frame_ranges(path, chunk):
+    """(start, end) ranges of at most chunk frames; the last one runs to the end"""
+    if path.lower().endswith(IMAGE_EXTENSIONS):
+        return [(0, None)]
+    starts = range(0, max(frame_count(path), 1), chunk)
+    return [(s, s + chunk) for s in starts[:-1]] + [(starts[-1], None)]
+
+def read_video(path, stride, start=0, end=None):
+    """Yield (frame index, seconds, frame) for every stride-th frame in [start, end)"""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError("unreadable video")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    index = 0
+    if start and cap.set(cv2.CAP_PROP_POS_FRAMES, start):
+        index = start
+    try:
+        while end is None or index < end:
+            # grab() skips frames without decoding them
+            if (index < start or index % stride) and cap.grab():
+                index += 1
+                continue
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield index, index / fps, frame
+            index += 1
+    finally:
+        cap.release()
+
+def detect(batch, tracker, path, rows):
+    """Run one batch through the detector and append its CSV rows"""
+    results = _detector.detect_batch([frame for _, _, frame in batch])
+    for (index, seconds, _), detections in zip(batch, results):
+        if tracker is not None:
+            detections = tracker.update(detections, seconds)
+        for det in detections:
+            x1, y1, x2, y2 = (int(v) for v in det.box)
+            rows.append((path, index, round(seconds, 3), det.track_id, int(det.class_id),
+                         round(float(det.score), 4), x1, y1, x2, y2))
+    return len(batch)
+
+def find_inputs(paths):
+    """Videos and images under the given paths, in a stable order"""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                found.extend(os.path.join(root, name) for name in sorted(files)
+                             if name.lower().endswith(VIDEO_EXTENSIONS + IMAGE_EXTENSIONS))
+        elif os.path.exists(path):
+            found.append(path)
+        else:
+            print(f"⚠️  Skipping missing input: {path}")
+    return found
+
+def file_key(path):
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}|{stat.st_size}|{int(stat.st_mtime)}"
+
+def run_settings(args):
+    """Everything that changes the rows written, as stored in the checkpoint"""
+    model = config.DETECTOR_MODEL
+    return {
+        'model': file_key(model) if model and os.path.exists(model) else model,
+        'input_size': config.DETECTOR_INPUT_SIZE,
+        'confidence': config.DETECTOR_CONFIDENCE,
+        'nms_threshold': config.DETECTOR_NMS_THRESHOLD,
+        'tiling': [config.DETECTOR_TILING, config.DETECTOR_TILE_OVERLAP, config.DETECTOR_TILE_FULL_FRAME],
+        'tracking': tracking_args(args),
+        'stride': max(1, args.stride),
+        'chunk': chunk_frames(args),
+    }
+
+def tracking_args(args):
+    if args.no_tracking:
+        return None
+    return {'iou_threshold': config.TRACK_IOU, 'min_hits': config.TRACK_MIN_HITS,
+            'max_age': config.TRACK_MAX_AGE}
+
+def chunk_frames(args):
+    """Frames per range, a multiple of the stride so ranges stay on the stride grid"""
+    stride = max(1, args.stride)
+    return max(stride, -(-args.chunk // stride) * stride)
+
+class Checkpoint:
+    def __init__(self, path):
+        """
+        Append-only record of finished frame ranges for resumable runs
+        Args:
+            path: JSON-lines file; the first line holds the run settings,
+                every other line a range key and the CSV size once that
+                range's rows were written
+        """
+        self.path = path
+        self.settings = None
+        self.done = {}
+        self.csv_size = 0
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # A line cut off by a crash ends the record
+                    if 'settings' in entry:
+                        self.settings = entry['settings']
+                        continue
+                    self.done[entry['key']] = entry
+                    self.csv_size = entry['csv_size']
+    
+    def start(self, settings):
+        """Write the settings line of a new checkpoint"""
+        with open(self.path, 'a') as f:
+            f.write(json.dumps({'settings': settings}) + '\n')
+        self.settings = settings
+    
+    def record(self, key, csv_size, **summary):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps({'key': key, 'csv_size': csv_size, **summary}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.done[key] = summary
+        self.csv_size = csv_size
+
+def run(args):
+    checkpoint_path = args.output + '.checkpoint'
+    if args.fresh:
+        for path in (args.output, checkpoint_path):
+            if os.path.exists(path):
+                os.remove(path)
+    elif (not os.path.exists(checkpoint_path) and os.path.exists(args.output)
+          and os.path.getsize(args.output) > 0):
+        print(f"❌ {args.output} exists but has no checkpoint; pass --fresh to overwrite it")
+        return 2
+    checkpoint = Checkpoint(checkpoint_path)
+    settings = run_settings(args)
+    if checkpoint.done and checkpoint.settings != settings:
+        print(f"❌ {args.output} was written with different settings "
+              f"({json.dumps(checkpoint.settings)}); pass --fresh to start over or use another output")
+        return 2
+    
+    inputs = find_inputs(args.inputs)
+    chunk = chunk_frames(args)
+    ranges = [(path, file_key(path), start, end)
+              for path in inputs for start, end in frame_ranges(path, chunk)]
+    pending = [(path, key, start, end) for path, key, start, end in ranges
+               if f"{key}#{start}" not in checkpoint.done]
+    files = len({path for path, _, _, _ in pending})
+    print(f"🗂️  {len(inputs)} inputs in {len(ranges)} frame ranges, "
+          f"{len(ranges) - len(pending)} already done, {len(pending)} to analyze ({files} files)")
+    if not pending:
+        return 0
+    
+    if checkpoint.settings != settings:
+        checkpoint.start(settings)  # Also marks the output as resumable from now on
+    
+    # Drop rows of a file that was in progress when the last run stopped
+    new_file = not os.path.exists(args.output)
+    if not new_file and os.path.getsize(args.output) > checkpoint.csv_size:
+        with open(args.output, 'r+b') as f:
+            f.truncate(checkpoint.csv_size)
+        new_file = checkpoint.csv_size == 0
+    
+    backend_args = (config.DETECTOR_MODEL, config.DETECTOR_INPUT_SIZE,
+                    config.DETECTOR_CONFIDENCE, config.DETECTOR_NMS_THRESHOLD,
+                    config.DETECTOR_TILING, config.DETECTOR_TILE_OVERLAP,
+                    config.DETECTOR_TILE_FULL_FRAME)
+    tasks = [(path, start, end, settings['stride'], max(1, args.batch), settings['tracking'])
+             for path, _, start, end in pending]
+    keys = {(path, start): key for path, key, start, _ in pending}
+    start = time.time()
+    frames_total = 0
+    detections_total = 0
+    failures = 0
+    
+    with open(args.output, 'a', newline='') as out, \
+         mp.get_context('spawn').Pool(args.workers, _init_worker, (backend_args,)) as pool:
+        writer = csv.writer(out)
+        if new_file:
+            writer.writerow(COLUMNS)
+        try:
+            for done, (path, first, frames, rows, unique, error) in enumerate(
+                    pool.imap_unordered(analyze_range, tasks), 1):
+                where = f"{path} @{first}" if first else path
+                if error is not None:
+                    # Not checkpointed, so the next run tries the range again
+                    failures += 1
+                    print(f"❌ [{done}/{len(tasks)}] {where}: {error}")
+                    continue
+                writer.writerows(rows)
+                out.flush()
+                checkpoint.record(f"{keys[path, first]}#{first}", out.tell(), frames=frames,
+                                  detections=len(rows), unique=unique)
+                frames_total += frames
+                detections_total += len(rows)
+                rate = frames_total / max(time.time() - start, 1e-6)
+                print(f"✅ [{done}/{len(tasks)}] {where}: {frames} frames, {len(rows)} detections"
+                      f"{'' if unique is None else f', {unique} weevils'} ({rate:.0f} frames/s overall)")
+        except KeyboardInterrupt:
+            pool.terminate()
+            print("⏹️  Interrupted - run the same command again to resume")
+            return 130
+    
+    elapsed = time.time() - start
+    print(f"📝 {frames_total} frames, {detections_total} detections in {elapsed:.1f}s "
+          f"({frames_total / max(elapsed, 1e-6):.0f} frames/s) -> {args.output}")
+    return 1 if failures else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Detect weevils in recorded videos and images")
+    parser.add_argument('inputs', nargs='+', help="video/image files or directories (searched recursively)")
+    parser.add_argument('-o', '--output', default='detections.csv', help="CSV file to append rows to")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument('--stride', type=int, default=1, help="analyze every Nth video frame")
+    parser.add_argument('--batch', type=int, default=config.DETECTOR_MAX_BATCH, help="frames per inference call")
+    parser.add_argument('--chunk', type=int, default=3000,
+                        help="video frames per task; ranges are checkpointed and run in parallel")
+    parser.add_argument('--no-tracking', action='store_true', help="leave track_id empty and skip unique counts")
+    parser.add_argument('--fresh', action='store_true', help="discard the output and checkpoint and start over")
+    return run(parser.parse_args(argv))
+
+if __name__ == '__main__':
+    sys.exit(main())
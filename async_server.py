@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Asyncio serving mode for the streaming endpoints
+
+Serves /video_feed, /frame, /detection, /thumbnails, /status and /events
+(plus the per-camera /cameras/<id>/... variants) from a single aiohttp event
+loop instead of one OS thread per viewer. Capture, detection and encoding still run on the
+same threads as in main.py; the processing threads only nudge the loop once
+per published frame, and every viewer of that frame is woken from there.
+
+    python async_server.py            # same port and cameras as main.py
+"""
+import asyncio
+import time
+try:
+    from aiohttp import web
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+import main
+from encoding import TIERS, DEFAULT_TIER
+
+class AsyncNotifier:
+    def __init__(self, source, loop):
+        """
+        Bridge a thread-side publisher (anything with add_listener) into the loop
+
+        The publishing thread schedules one callback per publish; coroutines
+        awaiting changed() are woken when that callback runs.
+        """
+        self.loop = loop
+        self.next = loop.create_future()
+        source.add_listener(self.on_publish)
+
+    def on_publish(self):
+        try:
+            self.loop.call_soon_threadsafe(self.resolve)
+        except RuntimeError:
+            pass  # Loop already closed during shutdown
+
+    def resolve(self):
+        future, self.next = self.next, self.loop.create_future()
+        future.set_result(None)
+
+    async def changed(self, timeout):
+        """Wait for the next publish; False on timeout"""
+        try:
+            await asyncio.wait_for(asyncio.shield(self.next), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+class AsyncFrameNotifier(AsyncNotifier):
+    def __init__(self, broadcaster, loop):
+        """AsyncNotifier for one FrameBroadcaster"""
+        super().__init__(broadcaster, loop)
+        self.broadcaster = broadcaster
+
+    async def wait_for(self, after_seq, timeout):
+        """Wait until a frame newer than after_seq exists; (seq, ts, jpeg, chunk, published) or None"""
+        deadline = self.loop.time() + timeout
+        while True:
+            packet = self.broadcaster.wait_for(after_seq, timeout=0)
+            if packet is not None or self.broadcaster.closed:
+                return packet
+            remaining = deadline - self.loop.time()
+            if remaining <= 0 or not await self.changed(remaining):
+                return None
+
+def camera_or_404(request):
+    camera = main.registry.get(request.match_info.get('camera_id'))
+    if camera is None:
+        raise web.HTTPNotFound(text=f"Unknown camera: {request.match_info.get('camera_id')}")
+    return camera
+
+def tier_or_400(request):
+    tier = request.query.get('tier', DEFAULT_TIER)
+    if tier not in TIERS:
+        raise web.HTTPBadRequest(text=f"Unknown tier: {tier} (choose from {', '.join(TIERS)})")
+    return tier
+
+def raise_if_warming_up(camera, detection=False):
+    """503 + Retry-After until the camera (and detector) are warm, as in main.py"""
+    reason = main.warming_up(camera, detection)
+    if reason is not None:
+        message, retry_after = reason
+        raise web.HTTPServiceUnavailable(text=message, headers={'Retry-After': str(retry_after)})
+
+def int_query(request, name, default=None):
+    try:
+        return int(request.query[name])
+    except (KeyError, ValueError):
+        return default
+
+async def video_feed(request):
+    """Streaming video feed endpoint (?tier=full|medium|thumb)"""
+    camera = camera_or_404(request)
+    tier = tier_or_400(request)
+    raise_if_warming_up(camera)
+    broadcaster = camera.broadcasters[tier]
+    notifier = request.app['notifiers'][camera.camera_id][tier]
+
+    response = web.StreamResponse(headers={'Content-Type': broadcaster.mimetype})
+    await response.prepare(request)
+    broadcaster.subscribe()
+    try:
+        last_seq = last_published = 0
+        while not broadcaster.closed:
+            packet = await notifier.wait_for(last_seq, timeout=5.0)
+            if packet is None:
+                continue
+            last_seq, _, _, chunk, published = packet
+            # A slow client resumes at the latest frame, skipping the rest
+            broadcaster.count_dropped(last_published, published)
+            last_published = published
+            start = time.perf_counter()
+            await response.write(chunk)
+            camera.metrics.observe('serve', time.perf_counter() - start)
+            camera.metrics.served.add()
+    except (ConnectionResetError, asyncio.CancelledError):
+        pass
+    finally:
+        broadcaster.unsubscribe()
+    return response
+
+async def get_frame(request):
+    """Single JPEG frame with the same ETag / long-poll semantics as main.py"""
+    start = time.perf_counter()
+    camera = camera_or_404(request)
+    tier = tier_or_400(request)
+    raise_if_warming_up(camera)
+    broadcaster = camera.broadcasters[tier]
+    notifier = request.app['notifiers'][camera.camera_id][tier]
+    broadcaster.touch()
+
+    after = int_query(request, 'after')
+    wait_ms = int_query(request, 'wait', 0)
+    if after is not None and after > broadcaster.latest()[0]:
+        after = None  # Stale seq from before a restart, as in main.py
+    if after is not None and wait_ms > 0:
+        await notifier.wait_for(after, min(wait_ms, main.max_frame_wait_ms) / 1000)
+
+    seq, last_frame_time, frame = broadcaster.latest()
+    if frame is None or (time.time() - last_frame_time) > 2:
+        # The tier may have been idle; give the pipeline one frame to catch up
+        await notifier.wait_for(seq, 1.0)
+        seq, last_frame_time, frame = broadcaster.latest()
+    if frame is None or (time.time() - last_frame_time) > 2:
+        return web.Response(status=503, text="Camera not available", headers={'Retry-After': '1'})
+
+    etag = main.frame_etag(camera, tier, seq)
+    headers = {
+        'ETag': f'"{etag}"',
+        'X-Frame-Seq': str(seq),
+        'Cache-Control': 'no-cache, must-revalidate'
+    }
+    overlay = broadcaster.overlay_for(seq)
+    if overlay is not None:
+        headers['X-Overlay'] = overlay.decode()
+    if_none_match = request.headers.get('If-None-Match', '')
+    if (after is not None and seq <= after) or f'"{etag}"' in if_none_match:
+        response = web.Response(status=304, headers=headers)
+    else:
+        response = web.Response(body=frame, content_type='image/jpeg', headers=headers)
+        camera.metrics.served.add()
+    if after is None or wait_ms <= 0:
+        camera.metrics.observe('serve', time.perf_counter() - start)
+    return response
+
+async def get_events(request):
+    """Server-Sent Events stream, same events as main.py's /events"""
+    bus = main.events
+    notifier = request.app['event_notifier']
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    await response.prepare(request)
+    last_id = bus.subscribe()
+    if 'Last-Event-ID' in request.headers:
+        last_id = bus.resume_point(request.headers['Last-Event-ID'])
+    try:
+        await response.write(b"retry: 3000\n\n")
+        while not bus.closed:
+            pending = bus.since(last_id)
+            if not pending:
+                if not await notifier.changed(15.0):
+                    await response.write(b": keep-alive\n\n")
+                continue
+            for last_id, message in pending:
+                await response.write(message)
+    except (ConnectionResetError, asyncio.CancelledError):
+        pass
+    finally:
+        bus.unsubscribe()
+    return response
+
+async def get_thumbnails(request):
+    """Cached camera grid, same caching and ETag as main.py's /thumbnails"""
+    # A rebuild decodes and encodes JPEGs, so keep it off the event loop
+    generation, jpeg, layout = await asyncio.to_thread(main.thumbnails.latest)
+    if request.query.get('format') == 'json':
+        return web.json_response(layout)
+    if jpeg is None:
+        return web.Response(status=503, text="Thumbnails not available")
+    etag = main.thumbnail_etag(generation)
+    headers = {
+        'ETag': f'"{etag}"',
+        'Cache-Control': f'max-age={int(main.config.THUMBNAIL_MAX_AGE)}'
+    }
+    if f'"{etag}"' in request.headers.get('If-None-Match', ''):
+        return web.Response(status=304, headers=headers)
+    return web.Response(body=jpeg, content_type='image/jpeg', headers=headers)
+
+async def get_detection(request):
+    camera = camera_or_404(request)
+    raise_if_warming_up(camera, detection=True)
+    return web.json_response(main.detection_payload(camera))
+
+def json_or_error(payload, args):
+    try:
+        return web.json_response(payload(args))
+    except ValueError as e:
+        raise web.HTTPBadRequest(text=str(e))
+    except main.HistoryDisabled as e:
+        raise web.HTTPNotFound(text=str(e))
+
+async def get_detections(request):
+    # SQLite reads block, so keep them off the event loop
+    return await asyncio.to_thread(json_or_error, main.history_payload, request.query)
+
+async def get_daily_detections(request):
+    return await asyncio.to_thread(json_or_error, main.daily_payload, request.query)
+
+async def get_status(request):
+    return web.json_response(main.status_payload())
+
+async def get_camera_status(request):
+    return web.json_response(camera_or_404(request).status())
+
+async def get_metrics(request):
+    memory_bytes = int(main.get_memory_usage() * 1024 * 1024) if main.PSUTIL_AVAILABLE else None
+    return web.Response(text=main.render_prometheus(main.registry.cameras.values(), memory_bytes),
+                        content_type='text/plain', headers={'X-Metrics-Format': '0.0.4'})
+
+@web.middleware
+async def cors_middleware(request, handler):
+    """Same permissive CORS headers as the Flask app"""
+    if request.method == 'OPTIONS':
+        response = web.Response()
+    else:
+        try:
+            response = await handler(request)
+        except web.HTTPException as e:
+            response = e
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    response.headers['Access-Control-Allow-Headers'] = 'Content-Type,Authorization'
+    response.headers['Access-Control-Allow-Methods'] = 'GET,PUT,POST,DELETE,OPTIONS'
+    response.headers['Access-Control-Allow-Credentials'] = 'true'
+    response.headers['Access-Control-Expose-Headers'] = 'ETag,X-Frame-Seq,X-Overlay'
+    return response
+
+async def on_startup(app):
+    loop = asyncio.get_running_loop()
+    app['notifiers'] = {
+        camera.camera_id: {tier: AsyncFrameNotifier(broadcaster, loop)
+                           for tier, broadcaster in camera.broadcasters.items()}
+        for camera in main.registry.cameras.values()
+    }
+    app['event_notifier'] = AsyncNotifier(main.events, loop)
+
+def create_app():
+    app = web.Application(middlewares=[cors_middleware])
+    app.on_startup.append(on_startup)
+    for prefix in ('', '/cameras/{camera_id}'):
+        app.router.add_get(prefix + '/video_feed', video_feed)
+        app.router.add_get(prefix + '/frame', get_frame)
+        app.router.add_get(prefix + '/detection', get_detection)
+    app.router.add_get('/thumbnails', get_thumbnails)
+    app.router.add_get('/status', get_status)
+    app.router.add_get('/cameras/{camera_id}/status', get_camera_status)
+    app.router.add_get('/events', get_events)
+    app.router.add_get('/detections', get_detections)
+    app.router.add_get('/detections/daily', get_daily_detections)
+    app.router.add_get('/metrics', get_metrics)
+    return app
+
+if __name__ == '__main__':
+    if not AIOHTTP_AVAILABLE:
+        raise SystemExit("❌ aiohttp is required for the async server: pip install aiohttp")
+    try:
+        main.start()
+        print("⚡ Serving streams from the asyncio event loop")
+        web.run_app(create_app(), host='0.0.0.0', port=5000)
+    finally:
+        main.stop()
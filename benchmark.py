@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the capture -> detect -> encode -> serve pipeline
+
+Runs without a physical camera, using a recorded video or the synthetic
+frame generator as the source:
+
+    # Headless pipeline throughput, 2 synthetic cameras, 30 s
+    python benchmark.py pipeline --source synthetic://1280x720@30 --cameras 2 --duration 30
+
+    # Same, from a recorded video decoded as fast as possible
+    python benchmark.py pipeline --source trap.mp4 --unpaced
+
+    # HTTP load against an in-process server with a synthetic camera
+    python benchmark.py http --serve --pollers 20 --streams 5 --duration 30
+
+    # HTTP load against a running server
+    python benchmark.py http --url http://127.0.0.1:5000 --pollers 20 --streams 5
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import sys
+import time
+from threading import Thread, Event, Lock
+from urllib.parse import urlsplit
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+def load_server(sources, env=None):
+    """Import main.py configured for the given sources (no camera hardware needed)"""
+    os.environ['WEEVIL_CAMERAS'] = ','.join(f'cam{i}={src}' for i, src in enumerate(sources))
+    # Synthetic detections must not end up in the real history or clip folder
+    os.environ['WEEVIL_DETECTION_DB'] = ''
+    os.environ['WEEVIL_CLIP_DIR'] = ''
+    os.environ.update(env or {})
+    import main
+    return main
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+class ResourceSampler:
+    def __init__(self, interval=1.0):
+        """Samples process CPU and memory once per interval in the background"""
+        self.interval = interval
+        self.cpu = []
+        self.rss_mb = []
+        self.done = Event()
+
+    def start(self):
+        if PSUTIL_AVAILABLE:
+            t = Thread(target=self.run, args=())
+            t.daemon = True
+            t.start()
+        return self
+
+    def run(self):
+        process = psutil.Process()
+        process.cpu_percent(None)
+        while not self.done.wait(self.interval):
+            self.cpu.append(process.cpu_percent(None))
+            self.rss_mb.append(process.memory_info().rss / 1024 / 1024)
+
+    def stop(self):
+        self.done.set()
+
+    def summary(self):
+        if not self.cpu:
+            return {'cpu_percent': None, 'rss_mb': None}
+        return {
+            'cpu_percent': {'mean': round(sum(self.cpu) / len(self.cpu), 1), 'max': max(self.cpu)},
+            'rss_mb': {'mean': round(sum(self.rss_mb) / len(self.rss_mb), 1), 'max': round(max(self.rss_mb), 1)}
+        }
+
+def run_pipeline(args):
+    """Drive the full pipeline headless and report throughput and stage latency"""
+    sources = [args.source] * args.cameras
+    server = load_server(sources)
+    if args.unpaced:
+        for camera in server.registry.cameras.values():
+            camera.capture['realtime'] = False
+
+    # In-process viewers keep the requested tiers encoded and measure serving
+    stop = Event()
+    def viewer(camera, tier):
+        for _ in server.generate_frames(camera, camera.broadcasters[tier]):
+            if stop.is_set():
+                return
+    for camera in server.registry.cameras.values():
+        for tier in args.tiers.split(','):
+            for _ in range(args.viewers):
+                t = Thread(target=viewer, args=(camera, tier))
+                t.daemon = True
+                t.start()
+
+    sampler = ResourceSampler().start()
+    server.start()
+    print(f"⏱️  Running pipeline benchmark for {args.duration}s ...")
+    time.sleep(args.warmup)
+    start_counts = {cid: (c.metrics.captured.total, c.metrics.processed.total, c.metrics.served.total)
+                    for cid, c in server.registry.cameras.items()}
+    started = time.monotonic()
+    time.sleep(args.duration)
+    elapsed = time.monotonic() - started
+    sampler.stop()
+    stop.set()
+
+    report = {'mode': 'pipeline', 'source': args.source, 'duration_s': round(elapsed, 1),
+              'cameras': {}, 'resources': sampler.summary()}
+    for cid, camera in server.registry.cameras.items():
+        m = camera.metrics
+        captured0, processed0, served0 = start_counts[cid]
+        report['cameras'][cid] = {
+            'capture_fps': round((m.captured.total - captured0) / elapsed, 1),
+            'processed_fps': round((m.processed.total - processed0) / elapsed, 1),
+            'served_fps': round((m.served.total - served0) / elapsed, 1),
+            'dropped_unprocessed': m.dropped_unprocessed,
+            'stream_dropped': sum(b.dropped for b in camera.broadcasters.values()),
+            'detections_run': camera.scheduler.submitted,
+            'queues': {q.name: q.status() for q in (camera.frames, camera.encodes)},
+            # Bucket-interpolated estimates from the pipeline histograms
+            'stage_ms': {stage: {q: round(h.quantile(v) * 1000, 2)
+                                 for q, v in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))}
+                         for stage, h in m.stages.items()}
+        }
+    server.stop()
+    return report
+
+class HttpLoad:
+    def __init__(self, base_url, duration):
+        """Concurrent /frame pollers and /video_feed subscribers against one server"""
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.duration = duration
+        self.lock = Lock()
+        self.poll_latency_ms = []
+        self.status_counts = {}
+        self.stream_frames = []
+        self.bytes_received = 0
+        self.errors = 0
+
+    def poller(self, path, long_poll):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=10)
+        etag, seq = None, 0
+        deadline = time.monotonic() + self.duration
+        while time.monotonic() < deadline:
+            url = self.prefix + path
+            if long_poll:
+                url += ('&' if '?' in url else '?') + f'after={seq}&wait=1000'
+            headers = {'If-None-Match': etag} if etag and not long_poll else {}
+            start = time.perf_counter()
+            try:
+                conn.request('GET', url, headers=headers)
+                response = conn.getresponse()
+                body = response.read()
+            except (OSError, http.client.HTTPException):
+                with self.lock:
+                    self.errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=10)
+                time.sleep(0.1)
+                continue
+            elapsed = (time.perf_counter() - start) * 1000
+            etag = response.getheader('ETag', etag)
+            seq = int(response.getheader('X-Frame-Seq', seq) or seq)
+            with self.lock:
+                self.poll_latency_ms.append(elapsed)
+                self.status_counts[response.status] = self.status_counts.get(response.status, 0) + 1
+                self.bytes_received += len(body)
+            if response.status == 503:
+                time.sleep(0.1)
+        conn.close()
+
+    def subscriber(self, path):
+        frames = 0
+        deadline = time.monotonic() + self.duration
+        try:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=10)
+            conn.request('GET', self.prefix + path)
+            response = conn.getresponse()
+            # Chunks carry Content-Length, so parts can be read without scanning
+            while time.monotonic() < deadline:
+                line = response.fp.readline()
+                if not line:
+                    break
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+                    response.fp.readline()
+                    response.fp.read(length)
+                    frames += 1
+                    with self.lock:
+                        self.bytes_received += length
+            conn.close()
+        except (OSError, http.client.HTTPException):
+            with self.lock:
+                self.errors += 1
+        with self.lock:
+            self.stream_frames.append(frames)
+
+    def run(self, pollers, streams, frame_path, feed_path, long_poll):
+        threads = [Thread(target=self.poller, args=(frame_path, long_poll)) for _ in range(pollers)]
+        threads += [Thread(target=self.subscriber, args=(feed_path,)) for _ in range(streams)]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join(self.duration + 15)
+
+        latency = self.poll_latency_ms
+        return {
+            'pollers': pollers,
+            'streams': streams,
+            'poll_requests_per_s': round(len(latency) / self.duration, 1),
+            'poll_status_counts': self.status_counts,
+            'poll_latency_ms': {q: round(percentile(latency, v), 2)
+                                for q, v in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))},
+            'stream_fps_per_client': round(sum(self.stream_frames) / max(1, len(self.stream_frames))
+                                           / self.duration, 1),
+            'received_mb_per_s': round(self.bytes_received / 1024 / 1024 / self.duration, 2),
+            'errors': self.errors
+        }
+
+def run_http(args):
+    """Run concurrent HTTP clients against a live or in-process server"""
+    base_url = args.url
+    sampler = None
+    if args.serve:
+        from werkzeug.serving import make_server
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)  # No per-request log lines
+        server = load_server([args.source])
+        server.start()
+        httpd = make_server('127.0.0.1', args.port, server.app, threaded=True)
+        t = Thread(target=httpd.serve_forever, args=())
+        t.daemon = True
+        t.start()
+        base_url = f'http://127.0.0.1:{args.port}'
+        sampler = ResourceSampler().start()  # Server runs in this process
+        time.sleep(args.warmup)
+
+    query = f'?tier={args.tier}'
+    print(f"⏱️  Running HTTP benchmark against {base_url} for {args.duration}s ...")
+    load = HttpLoad(base_url, args.duration)
+    report = load.run(args.pollers, args.streams, '/frame' + query, '/video_feed' + query, args.long_poll)
+    report = {'mode': 'http', 'url': base_url, 'tier': args.tier, 'long_poll': args.long_poll, **report}
+    if sampler is not None:
+        sampler.stop()
+        report['server_resources'] = sampler.summary()
+        httpd.shutdown()
+        server.stop()
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the weevil detection pipeline offline")
+    sub = parser.add_subparsers(dest='mode', required=True)
+
+    pipeline = sub.add_parser('pipeline', help="headless capture/detect/encode/serve throughput")
+    pipeline.add_argument('--cameras', type=int, default=1, help="number of pipelines to run")
+    pipeline.add_argument('--tiers', default='full', help="comma separated tiers to keep encoded")
+    pipeline.add_argument('--viewers', type=int, default=1, help="in-process viewers per tier")
+    pipeline.add_argument('--unpaced', action='store_true', help="decode video files as fast as possible")
+
+    load = sub.add_parser('http', help="concurrent /frame pollers and /video_feed subscribers")
+    load.add_argument('--url', default='http://127.0.0.1:5000', help="server to load")
+    load.add_argument('--serve', action='store_true', help="start an in-process server on --source")
+    load.add_argument('--port', type=int, default=5055, help="port for --serve")
+    load.add_argument('--pollers', type=int, default=10, help="concurrent /frame pollers")
+    load.add_argument('--streams', type=int, default=2, help="concurrent /video_feed subscribers")
+    load.add_argument('--tier', default='full', help="encoding tier requested by clients")
+    load.add_argument('--long-poll', action='store_true', help="poll with ?after=&wait= instead of ETags")
+
+    for p in (pipeline, load):
+        p.add_argument('--source', default='synthetic://1280x720@30',
+                       help="video file or synthetic://WIDTHxHEIGHT@FPS")
+        p.add_argument('--duration', type=float, default=20, help="measured seconds")
+        p.add_argument('--warmup', type=float, default=2, help="seconds before measuring")
+        p.add_argument('--json', help="also write the report to this file")
+
+    args = parser.parse_args(argv)
+    report = run_pipeline(args) if args.mode == 'pipeline' else run_http(args)
+
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"📝 Report written to {args.json}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
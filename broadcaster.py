@@ -0,0 +1,158 @@
+from threading import Condition
+import time
+
+class FrameBroadcaster:
+    def __init__(self, boundary=b'frame'):
+        """
+        Encode-once, fan-out publisher for multipart MJPEG streams
+        Args:
+            boundary: Multipart boundary used in the stream mimetype
+        """
+        self.boundary = boundary
+        self.changed = Condition()
+        self.seq = 0        # Capture sequence number of the latest frame
+        self.published = 0  # Frames published so far
+        self.timestamp = 0.0
+        self.frame = None   # Latest JPEG (memoryview into chunk)
+        self.frame_bytes = None  # Latest JPEG as bytes, made on first request
+        self.chunk = None   # Latest multipart chunk (boundary + headers + JPEG)
+        self.overlay = None  # Overlay metadata (JSON bytes) of the latest frame
+        self.subscribers = 0
+        self.dropped = 0    # Frames skipped by subscribers that fell behind
+        self.last_request = 0.0  # Last single-frame (/frame) request
+        self.pinned = 0     # Consumers (e.g. clip recording) that need every frame
+        self.listeners = []  # Called with no arguments after every publish
+        self.closed = False
+    
+    @property
+    def mimetype(self):
+        return 'multipart/x-mixed-replace; boundary=' + self.boundary.decode()
+    
+    def publish(self, jpeg, overlay=None, seq=None):
+        """
+        Build the multipart chunk once and wake every subscriber
+        Args:
+            jpeg: Encoded frame (bytes or any buffer, e.g. a memoryview over
+                the encoder's output)
+            overlay: Overlay metadata for this frame (compact JSON bytes),
+                sent as the part's X-Overlay header
+            seq: Capture sequence number of the frame (the frame_seq that
+                events and /detection report); frames are numbered 1, 2,
+                ... when omitted
+        
+        The JPEG is copied exactly once, into the chunk; the frame handed to
+        /frame clients is a zero-copy view of the chunk's JPEG part.
+        """
+        header = (b'--' + self.boundary + b'\r\n'
+                  b'Content-Type: image/jpeg\r\n'
+                  + (b'X-Overlay: ' + overlay + b'\r\n' if overlay else b'') +
+                  b'Content-Length: ' + str(len(jpeg)).encode() + b'\r\n\r\n')
+        chunk = header + jpeg + b'\r\n'
+        frame = memoryview(chunk)[len(header):len(chunk) - 2]
+        with self.changed:
+            self.seq = self.seq + 1 if seq is None else seq
+            self.published += 1
+            self.timestamp = time.time()
+            self.frame = frame
+            self.frame_bytes = None
+            self.chunk = chunk
+            self.overlay = overlay
+            self.changed.notify_all()
+        for listener in self.listeners:
+            listener()
+    
+    def add_listener(self, listener):
+        """Call listener() from the publishing thread after every new frame"""
+        self.listeners.append(listener)
+    
+    def subscribe(self):
+        with self.changed:
+            self.subscribers += 1
+    
+    def unsubscribe(self):
+        with self.changed:
+            self.subscribers -= 1
+    
+    def pin(self):
+        """Keep this broadcaster wanted regardless of viewers"""
+        with self.changed:
+            self.pinned += 1
+    
+    def touch(self):
+        """Record demand from a single-frame request"""
+        self.last_request = time.time()
+    
+    def wanted(self, idle_seconds=5.0):
+        """True while someone streams, pins or recently polled this broadcaster"""
+        return self.subscribers > 0 or self.pinned > 0 or (time.time() - self.last_request) < idle_seconds
+    
+    def latest(self):
+        """Return (seq, timestamp, jpeg) for the most recent frame"""
+        with self.changed:
+            return self.seq, self.timestamp, self.frame
+    
+    def latest_bytes(self):
+        """
+        Like latest(), with the JPEG as bytes for servers that need them
+        
+        WSGI only accepts bytes, so the copy is made once per frame, on the
+        first request for it, and shared by every later request.
+        """
+        with self.changed:
+            if self.frame is not None and self.frame_bytes is None:
+                self.frame_bytes = self.frame.tobytes()
+            return self.seq, self.timestamp, self.frame_bytes
+    
+    def overlay_for(self, seq):
+        """Overlay metadata of frame seq, or None once a newer frame replaced it"""
+        with self.changed:
+            return self.overlay if self.seq == seq else None
+    
+    def wait_for(self, after_seq=0, timeout=None):
+        """
+        Block until a frame newer than after_seq is published
+        Returns:
+            (seq, timestamp, jpeg, chunk, published) tuple, or None on
+            timeout or close
+        """
+        with self.changed:
+            self.changed.wait_for(
+                lambda: self.closed or (self.chunk is not None and self.seq > after_seq),
+                timeout)
+            if self.closed or self.chunk is None or self.seq <= after_seq:
+                return None
+            return self.seq, self.timestamp, self.frame, self.chunk, self.published
+    
+    def stream(self, timeout=5.0):
+        """
+        Generator yielding each new multipart chunk exactly once
+        
+        A subscriber that is still writing the previous chunk when newer
+        frames arrive simply skips to the latest one, so a slow client
+        drops frames instead of queueing them or holding up other clients.
+        """
+        self.subscribe()
+        try:
+            last_seq = last_published = 0
+            while not self.closed:
+                packet = self.wait_for(last_seq, timeout)
+                if packet is None:
+                    continue
+                last_seq, _, _, chunk, published = packet
+                self.count_dropped(last_published, published)
+                last_published = published
+                yield chunk
+        finally:
+            self.unsubscribe()
+    
+    def count_dropped(self, last_published, published):
+        """Record frames a subscriber skipped between two published counts"""
+        if last_published and published > last_published + 1:
+            with self.changed:
+                self.dropped += published - last_published - 1
+    
+    def close(self):
+        """Release every waiting subscriber"""
+        with self.changed:
+            self.closed = True
+            self.changed.notify_all()
@@ -0,0 +1,454 @@
+from threading import Thread
+import time
+import cv2
+import numpy as np
+from videostream import open_stream, FramePool
+from broadcaster import FrameBroadcaster
+from detectors import DetectionScheduler
+from encoding import create_encoders, DEFAULT_TIER
+from metrics import PipelineMetrics
+from motion import MotionGate
+from queues import StageQueue, DROP_OLDEST
+from tracker import Tracker
+from overlay import OverlayCompositor, overlay_metadata
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+    print("⚠️  psutil not available - memory monitoring disabled")
+
+memory_check_interval = 100  # Check memory every 100 frames
+
+def get_memory_usage():
+    """Get current memory usage in MB"""
+    if PSUTIL_AVAILABLE:
+        process = psutil.Process()
+        return process.memory_info().rss / 1024 / 1024
+    return 0
+
+def parse_sources(spec):
+    """
+    Parse a camera list such as "front=0,back=1,gate=rtsp://host/stream"
+    
+    Entries without an explicit id are numbered by position; numeric sources
+    are treated as device indices, anything else as a file path or URL.
+    """
+    sources = []
+    for index, entry in enumerate(e.strip() for e in spec.split(',')):
+        if not entry:
+            continue
+        camera_id, sep, src = entry.partition('=')
+        if not sep or '://' in camera_id:
+            camera_id, src = str(index), entry
+        sources.append((camera_id.strip(), int(src) if src.strip().isdigit() else src.strip()))
+    return sources
+
+class CameraPipeline:
+    def __init__(self, camera_id, src, batcher, stride=1, adaptive=False,
+                 encode_adaptive=False, encode_budget_ms=20.0, tier_idle_seconds=5.0,
+                 motion=None, motion_skip_encode=False, capture=None,
+                 negotiate=False, min_capture_width=640,
+                 capture_queue=(2, DROP_OLDEST), encode_queue=(2, DROP_OLDEST),
+                 tracking=None, track_stride=1, overlay='burn'):
+        """
+        Capture -> detect/overlay -> encode pipeline for one camera
+        Args:
+            camera_id: Id used in /cameras/<id>/... routes
+            src: Device index, file path, stream URL or synthetic:// source
+            batcher: MicroBatcher shared by every camera
+            stride, adaptive: DetectionScheduler policy
+            encode_adaptive, encode_budget_ms: TierEncoder quality policy
+            tier_idle_seconds: Stop encoding a tier this long after its last client
+            motion: MotionGate options; frames without motion skip detection
+                (None runs detection on every scheduled frame)
+            motion_skip_encode: Also skip encoding static frames, republishing
+                the last frame about once a second so viewers stay live
+            capture: VideoStream capture options (backend, fourcc, width,
+                height, passthrough)
+            negotiate: Lower the capture resolution to what the active tiers
+                need, but never below min_capture_width (the detector input)
+            capture_queue, encode_queue: (maxsize, policy) of the StageQueues
+                feeding the analyze and encode threads
+            tracking: Tracker options; detections get stable track ids and
+                are counted once per weevil (None counts frames with a weevil)
+            track_stride: Detection stride while every track is steady; the
+                overlay propagates tracked boxes in between
+            overlay: 'burn' draws boxes and labels into the frames; 'client'
+                serves clean frames and leaves drawing to clients, which get
+                each frame's boxes as metadata either way
+        
+        Capture, analyze (motion gate, detection hand-off, overlay) and encode
+        each run on their own thread, joined by bounded StageQueues whose
+        policy decides what happens when the next stage falls behind.
+        Detection runs behind the scheduler (one frame in flight) and slow
+        viewers skip to the latest frame in their broadcaster.
+        """
+        self.camera_id = camera_id
+        self.src = src
+        # The device is opened by start(), in the background, so creating a
+        # pipeline (and importing main.py) never touches hardware
+        self.capture = dict(capture or {})
+        self.stream = None
+        self.started = False
+        self.open_error = None
+        self.negotiate = negotiate
+        self.min_capture_width = min_capture_width
+        self.last_negotiation = 0.0
+        self.decoded = 0  # Passthrough JPEGs that had to be decoded
+        self.tracker = Tracker(**tracking) if tracking is not None else None
+        self.scheduler = DetectionScheduler(batcher, stride=stride, adaptive=adaptive,
+                                            tracker=self.tracker, track_stride=track_stride)
+        # One encoder and broadcaster per resolution tier, shared by every viewer
+        self.encoders = create_encoders(encode_adaptive, encode_budget_ms)
+        self.broadcasters = {tier: FrameBroadcaster() for tier in self.encoders}
+        self.broadcaster = self.broadcasters[DEFAULT_TIER]
+        self.tier_idle_seconds = tier_idle_seconds
+        self.metrics = PipelineMetrics()
+        self.scheduler.add_listener(
+            lambda seq, detections, latency: self.metrics.observe('detect', latency))
+        self.motion = MotionGate(**motion) if motion is not None else None
+        self.motion_skip_encode = motion_skip_encode
+        self.last_publish = 0.0
+        # Frames wait here for the analyze thread (borrowed capture buffers)
+        self.frames = StageQueue('capture', *capture_queue,
+                                 on_drop=lambda item: self.stream.release(item[2]))
+        # Annotated frames wait here for the encode thread; their canvases
+        # come from a small pool sized so queued ones are never reused
+        self.encodes = StageQueue('encode', *encode_queue, on_drop=self.recycle_canvas)
+        self.canvases = FramePool(self.encodes.maxsize + 2)
+        if overlay not in ('burn', 'client'):
+            raise ValueError(f"Unknown overlay mode: {overlay} (choose from burn, client)")
+        self.overlay = overlay
+        self.compositor = OverlayCompositor()
+        self.recorder = None  # ClipRecorder, when clip recording is enabled
+        self.last_frame_time = 0.0
+        self.frame_count = 0
+        self.stopped = False
+    
+    def start(self):
+        """Open the camera and start the pipeline threads in the background"""
+        self.started = True
+        self.init_thread = Thread(target=self.open, args=())
+        self.init_thread.daemon = True
+        self.init_thread.start()
+        return self
+    
+    def open(self):
+        try:
+            stream = open_stream(self.src, **self.capture)
+        except Exception as e:
+            self.open_error = str(e)
+            print(f"❌ Camera {self.camera_id} failed to open: {e}")
+            return
+        if not stream.is_opened():
+            if not stream.reconnect:
+                self.open_error = f"Could not open {self.src}"
+                print(f"❌ Camera {self.camera_id}: {self.open_error}")
+                stream.stop()
+                return
+            # A device that is absent at boot is retried like one that drops out
+            print(f"⚠️  Camera {self.camera_id}: could not open {self.src} - retrying in the background")
+        if self.stopped:
+            stream.stop()
+            return
+        stream.add_consumer(self.frames)
+        self.stream = stream
+        self.stream.start()
+        self.thread = Thread(target=self.process_frame_continuously, args=())
+        self.thread.daemon = True
+        self.thread.start()
+        self.encode_thread = Thread(target=self.encode_frames_continuously, args=())
+        self.encode_thread.daemon = True
+        self.encode_thread.start()
+        print(f"🔍 Frame processing thread started for camera {self.camera_id}")
+    
+    @property
+    def state(self):
+        """
+        idle -> starting (opening the device) -> warming -> ready, or failed;
+        stalled / reconnecting while the capture watchdog reports a problem
+        """
+        if self.open_error is not None:
+            return 'failed'
+        if self.stream is None:
+            return 'starting' if self.started else 'idle'
+        if self.stream.health != 'ok':
+            return self.stream.health
+        return 'ready' if self.frame_count > 0 else 'warming'
+    
+    @property
+    def ready(self):
+        return self.state == 'ready'
+    
+    def process_frame_continuously(self):
+        """Continuously process frames in a separate thread"""
+        last_seq = 0
+        while not self.stopped:
+            try:
+                # Next captured frame; the pooled buffer is borrowed, read-only,
+                # until release()
+                packet = self.frames.get(timeout=1.0)
+                if packet is None:
+                    continue
+                seq, captured_at, frame = packet
+                try:
+                    if frame is None:
+                        continue
+                    self.metrics.observe('capture', max(0.0, time.time() - captured_at))
+                    self.metrics.captured.add(seq - last_seq)
+                    if last_seq and seq > last_seq + 1:
+                        self.metrics.dropped_unprocessed += seq - last_seq - 1
+                    last_seq = seq
+                    self.process_frame(seq, frame)
+                finally:
+                    self.stream.release(frame)
+                
+            except Exception as e:
+                print(f"Frame processing error ({self.camera_id}): {e}")
+                time.sleep(0.1)
+    
+    def encode_frames_continuously(self):
+        """Encode thread: publish annotated frames for every wanted tier"""
+        while not self.stopped:
+            item = self.encodes.get(timeout=1.0)
+            if item is None:
+                continue
+            try:
+                seq, canvas, jpeg, metadata = item
+                encode_start = time.perf_counter()
+                # Encode only the tiers somebody is watching, scaling each
+                # tier down from the previous (larger) one
+                self.encode_tiers(canvas, jpeg, metadata, seq)
+                self.last_publish = time.time()
+                self.metrics.observe('encode', time.perf_counter() - encode_start)
+            except Exception as e:
+                print(f"Frame encoding error ({self.camera_id}): {e}")
+                time.sleep(0.1)
+            finally:
+                self.recycle_canvas(item)
+    
+    def recycle_canvas(self, item):
+        """Return an encode item's canvas to its pool (decode callables are dropped)"""
+        canvas = item[1]
+        if callable(canvas):
+            return
+        if self.overlay == 'client':
+            self.stream.release(canvas)  # A clean capture buffer, lent for encoding
+        else:
+            self.canvases.give(canvas)
+    
+    def process_frame(self, seq, frame):
+        """
+        Detect and overlay one borrowed (read-only) capture frame, then
+        queue it for the encode thread
+        
+        In passthrough mode the frame is the camera's own JPEG: it is only
+        decoded when something needs pixels (a detection, an overlay or a
+        scaled tier), and goes to full-tier viewers untouched otherwise.
+        """
+        jpeg = frame if self.stream.format == 'jpeg' else None
+        pixels = self.decoder(jpeg) if jpeg is not None else (lambda: frame)
+        
+        # Static frames never reach the detector; the last result stands
+        # until something moves or the gate's periodic check comes due
+        if self.motion is None:
+            moving = True
+        else:
+            # A reduced decode is enough for the motion check
+            moving = self.motion.check(frame if jpeg is None else
+                                       cv2.imdecode(jpeg, cv2.IMREAD_REDUCED_GRAYSCALE_4))
+        if not moving and self.motion_skip_encode and time.time() - self.last_publish < 1.0:
+            self.last_frame_time = time.time()
+            self.frame_count += 1
+            return
+        
+        # Hand the frame to the detection worker if the schedule allows,
+        # then overlay the most recent finished result without waiting
+        # (the batcher copies what it keeps)
+        if moving:
+            self.scheduler.offer(seq, pixels)
+        detections = self.scheduler.current()
+        
+        # Nothing to draw or encode while no tier has demand
+        if any(b.wanted(self.tier_idle_seconds) for b in self.broadcasters.values()):
+            overlay_start = time.perf_counter()
+            size = frame.shape[1::-1] if jpeg is None else self.stream.current_size()
+            metadata = overlay_metadata(detections, size)
+            if jpeg is not None and (not detections or self.overlay == 'client'):
+                # Nothing to draw: the camera's JPEG is the full tier as is
+                self.metrics.observe('overlay', time.perf_counter() - overlay_start)
+                self.encodes.put((seq, pixels, jpeg, metadata))
+            elif self.overlay == 'client':
+                # Clean stream: encode the capture buffer itself, borrowed
+                # once more until the encode thread is done with it
+                with self.stream.frame_ready:
+                    self.stream.lend(frame)
+                self.metrics.observe('overlay', time.perf_counter() - overlay_start)
+                self.encodes.put((seq, frame, None, metadata))
+            else:
+                if jpeg is not None:
+                    frame = pixels()  # A fresh decode is already private
+                else:
+                    # Draw on a pooled private copy; the capture buffer goes back to its pool
+                    canvas = self.canvases.take(frame.shape)
+                    if canvas is None:
+                        canvas = np.empty_like(frame)
+                    np.copyto(canvas, frame)
+                    frame = canvas
+                self.compositor.draw(frame, detections)
+                self.metrics.observe('overlay', time.perf_counter() - overlay_start)
+                self.encodes.put((seq, frame, None, metadata))
+        self.metrics.processed.add()
+        self.last_frame_time = time.time()
+        self.frame_count += 1
+        self.negotiate_resolution()
+        self.check_memory()
+    
+    def decoder(self, jpeg):
+        """Zero-argument callable that decodes a passthrough JPEG once, on first use"""
+        decoded = []
+        def decode():
+            if not decoded:
+                decoded.append(cv2.imdecode(jpeg, cv2.IMREAD_COLOR))
+                self.decoded += 1
+            return decoded[0]
+        return decode
+    
+    def negotiate_resolution(self):
+        """Once a second, capture at the smallest size the wanted tiers need"""
+        now = time.time()
+        if not self.negotiate or now - self.last_negotiation < 1.0:
+            return
+        self.last_negotiation = now
+        needed = self.min_capture_width
+        for tier, encoder in self.encoders.items():
+            if self.broadcasters[tier].wanted(self.tier_idle_seconds):
+                needed = max(needed, encoder.width or self.stream.max_size[0])
+        self.stream.request_width(needed)
+    
+    def encode_tiers(self, frame, jpeg=None, metadata=None, seq=None):
+        """
+        Encode and publish the frame for every tier that has demand
+        Args:
+            frame: BGR frame, or a callable returning one (called only if a
+                tier has to be encoded)
+            jpeg: Camera JPEG published as-is for the full-resolution tier
+            metadata: Overlay metadata (JSON bytes) published with the frame
+            seq: Capture sequence number, published as the frame's seq so
+                /frame and /detection number frames alike
+        """
+        for tier, encoder in self.encoders.items():
+            broadcaster = self.broadcasters[tier]
+            if not broadcaster.wanted(self.tier_idle_seconds):
+                continue
+            if jpeg is not None and encoder.width is None:
+                broadcaster.publish(memoryview(jpeg.reshape(-1)), metadata, seq)
+                continue
+            if callable(frame):
+                frame = frame()
+            frame = encoder.scale(frame)
+            jpeg = encoder.encode(frame, backlog=broadcaster.dropped)
+            if jpeg is not None:
+                # Publish once; every client of this tier shares the chunk
+                broadcaster.publish(jpeg, metadata, seq)
+    
+    def check_memory(self):
+        """
+        Periodic memory monitoring
+        
+        Frames come from a recycled pool and JPEGs are copied once, so there
+        is no garbage to force out; a forced gc.collect() here only stalled
+        the stream.
+        """
+        frame_count = self.frame_count
+        if frame_count % memory_check_interval != 0 or not PSUTIL_AVAILABLE:
+            return
+        memory_mb = get_memory_usage()
+        if memory_mb > 500:  # If using more than 500MB
+            print(f"⚠️  High memory usage: {memory_mb:.1f}MB ({self.camera_id})")
+        elif frame_count % (memory_check_interval * 10) == 0:  # Every 1000 frames
+            print(f"📊 Memory usage: {memory_mb:.1f}MB, Frames processed ({self.camera_id}): {frame_count}")
+    
+    def status(self):
+        """Per-camera status summary used by /status"""
+        return {
+            'camera_id': self.camera_id,
+            'state': self.state,
+            'error': self.open_error,
+            'camera_active': self.frame_count > 0 and (time.time() - self.last_frame_time) < 5,
+            'total_detections': self.scheduler.detection_count,
+            'last_frame_time': self.last_frame_time,
+            'frames_processed': self.frame_count,
+            'detection_stride': self.scheduler.stride,
+            'detection_latency_ms': round(self.scheduler.latency * 1000, 1),
+            'detection_inference_ms': round(self.scheduler.batcher.inference_time * 1000, 1),
+            'stream_clients': sum(b.subscribers for b in self.broadcasters.values()),
+            'stream_dropped_frames': sum(b.dropped for b in self.broadcasters.values()),
+            'metrics': self.metrics.summary(),
+            'tiers': {tier: {
+                'active': self.broadcasters[tier].wanted(self.tier_idle_seconds),
+                'clients': self.broadcasters[tier].subscribers,
+                'quality': encoder.quality,
+                'encode_ms': round(encoder.encode_ms, 2)
+            } for tier, encoder in self.encoders.items()},
+            'capture': {**self.stream.status(), 'passthrough_decodes': self.decoded}
+                       if self.stream is not None else None,
+            'queues': {q.name: q.status() for q in (self.frames, self.encodes)},
+            'frame_pool': {'allocated': self.stream.pool.allocated, 'reused': self.stream.pool.reused}
+                          if self.stream is not None else None,
+            'motion': self.motion.status() if self.motion is not None else None,
+            'tracking': self.tracker.status() if self.tracker is not None else None,
+            'clips': self.recorder.status() if self.recorder is not None else None
+        }
+    
+    def stop(self):
+        self.stopped = True
+        # Closing the queues first frees a capture thread blocked on a full one
+        self.frames.close()
+        self.encodes.close()
+        for broadcaster in self.broadcasters.values():
+            broadcaster.close()
+        init_thread = getattr(self, 'init_thread', None)
+        if init_thread is not None:
+            init_thread.join(timeout=5.0)
+        if self.stream is not None:
+            self.stream.stop()
+        for thread in (getattr(self, 'thread', None), getattr(self, 'encode_thread', None)):
+            if thread is not None:
+                thread.join(timeout=2.0)
+        if self.recorder is not None:
+            self.recorder.stop()
+
+class CameraRegistry:
+    def __init__(self, batcher, **pipeline_options):
+        """Owns one CameraPipeline per configured source"""
+        self.batcher = batcher
+        self.pipeline_options = pipeline_options  # Passed to every CameraPipeline
+        self.cameras = {}  # camera id -> CameraPipeline, in config order
+    
+    def add(self, camera_id, src):
+        if camera_id in self.cameras:
+            raise ValueError(f"Duplicate camera id: {camera_id}")
+        pipeline = CameraPipeline(camera_id, src, self.batcher, **self.pipeline_options)
+        self.cameras[camera_id] = pipeline
+        return pipeline
+    
+    @property
+    def default(self):
+        """First configured camera - served by the legacy single-camera routes"""
+        return next(iter(self.cameras.values()), None)
+    
+    def get(self, camera_id=None):
+        if camera_id is None:
+            return self.default
+        return self.cameras.get(camera_id)
+    
+    def start(self):
+        for pipeline in self.cameras.values():
+            pipeline.start()
+        return self
+    
+    def stop(self):
+        for pipeline in self.cameras.values():
+            pipeline.stop()
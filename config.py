@@ -0,0 +1,124 @@
+import os
+
+# Server-side settings. Every value can be overridden with an environment
+# variable so field units can be tuned without editing code.
+
+# Detector backend: path to an ONNX model, or empty for the demo detector
+DETECTOR_MODEL = os.environ.get('WEEVIL_MODEL', '')
+DETECTOR_INPUT_SIZE = int(os.environ.get('WEEVIL_INPUT_SIZE', 640))
+DETECTOR_CONFIDENCE = float(os.environ.get('WEEVIL_CONFIDENCE', 0.25))
+DETECTOR_NMS_THRESHOLD = float(os.environ.get('WEEVIL_NMS_THRESHOLD', 0.45))
+
+# Tiled inference: run the detector on overlapping INPUT_SIZE tiles at full
+# resolution (plus the whole frame downscaled when TILE_FULL_FRAME is set)
+# so small insects survive; costs one inference per tile
+DETECTOR_TILING = os.environ.get('WEEVIL_TILING', '0') == '1'
+DETECTOR_TILE_OVERLAP = float(os.environ.get('WEEVIL_TILE_OVERLAP', 0.2))
+DETECTOR_TILE_FULL_FRAME = os.environ.get('WEEVIL_TILE_FULL_FRAME', '1') == '1'
+
+# Micro-batching: group up to MAX_BATCH frames, waiting at most BATCH_WAIT_MS
+# after the first frame of a batch arrives, and no longer once every active
+# camera has a frame in the batch
+DETECTOR_MAX_BATCH = int(os.environ.get('WEEVIL_MAX_BATCH', 4))
+DETECTOR_BATCH_WAIT_MS = float(os.environ.get('WEEVIL_BATCH_WAIT_MS', 20))
+
+# Detection scheduling: run detection on every Nth displayed frame, or let
+# the stride follow measured inference latency when ADAPTIVE is enabled
+DETECTION_STRIDE = int(os.environ.get('WEEVIL_DETECTION_STRIDE', 1))
+DETECTION_ADAPTIVE = os.environ.get('WEEVIL_DETECTION_ADAPTIVE', '0') == '1'
+
+# Tracking: link detections into tracks so each weevil is counted once.
+# A track counts after TRACK_MIN_HITS detections and is dropped after
+# TRACK_MAX_AGE seconds unseen; while every track is steady the detector
+# runs on every TRACK_STRIDE-th frame and boxes are propagated in between
+TRACKING = os.environ.get('WEEVIL_TRACKING', '1') == '1'
+TRACK_IOU = float(os.environ.get('WEEVIL_TRACK_IOU', 0.3))
+TRACK_MIN_HITS = int(os.environ.get('WEEVIL_TRACK_MIN_HITS', 2))
+TRACK_MAX_AGE = float(os.environ.get('WEEVIL_TRACK_MAX_AGE', 2.0))
+TRACK_STRIDE = int(os.environ.get('WEEVIL_TRACK_STRIDE', 3))
+
+# Overlay: 'burn' draws boxes and labels into the served frames; 'client'
+# serves clean frames and clients draw from the X-Overlay metadata sent
+# with every frame (/frame header and each /video_feed part)
+OVERLAY = os.environ.get('WEEVIL_OVERLAY', 'burn')
+
+# Cameras served by this node: comma separated "id=source" entries where the
+# source is a device index, video file or stream URL, e.g.
+#   WEEVIL_CAMERAS="trap1=0,trap2=1,gate=rtsp://10.0.0.5/stream"
+CAMERAS = os.environ.get('WEEVIL_CAMERAS', '0')
+
+# Capture: OpenCV backend (auto, v4l2, ffmpeg, gstreamer, dshow, msmf,
+# avfoundation), pixel format requested from the device (e.g. MJPG) and the
+# largest resolution to ask for. PASSTHROUGH serves an MJPG camera's own
+# JPEGs to full-resolution viewers, decoding only frames that are detected
+# on or annotated. NEGOTIATE drops the capture resolution while no client
+# needs full size, down to the detector input size
+CAPTURE_BACKEND = os.environ.get('WEEVIL_CAPTURE_BACKEND', 'auto')
+CAPTURE_FOURCC = os.environ.get('WEEVIL_CAPTURE_FOURCC', '')
+CAPTURE_WIDTH = int(os.environ.get('WEEVIL_CAPTURE_WIDTH', 1280))
+CAPTURE_HEIGHT = int(os.environ.get('WEEVIL_CAPTURE_HEIGHT', 720))
+CAPTURE_PASSTHROUGH = os.environ.get('WEEVIL_CAPTURE_PASSTHROUGH', '0') == '1'
+CAPTURE_NEGOTIATE = os.environ.get('WEEVIL_CAPTURE_NEGOTIATE', '0') == '1'
+
+# Capture watchdog: a camera that delivers no frame for STALL_SECONDS (or
+# keeps failing reads) is reopened, waiting 0.5 s, 1 s, 2 s ... up to
+# MAX_BACKOFF seconds between attempts
+CAPTURE_STALL_SECONDS = float(os.environ.get('WEEVIL_CAPTURE_STALL_SECONDS', 5))
+CAPTURE_MAX_BACKOFF = float(os.environ.get('WEEVIL_CAPTURE_MAX_BACKOFF', 30))
+
+# Stage queues: frames wait for the analyze thread (motion gate, detection
+# hand-off, overlay) in the capture queue and for the encode thread in the
+# encode queue. When a queue is full its policy applies: drop-oldest keeps
+# the newest frames, drop-newest keeps the queued ones, block makes the
+# producing stage wait
+CAPTURE_QUEUE_SIZE = int(os.environ.get('WEEVIL_CAPTURE_QUEUE_SIZE', 2))
+CAPTURE_QUEUE_POLICY = os.environ.get('WEEVIL_CAPTURE_QUEUE_POLICY', 'drop-oldest')
+ENCODE_QUEUE_SIZE = int(os.environ.get('WEEVIL_ENCODE_QUEUE_SIZE', 2))
+ENCODE_QUEUE_POLICY = os.environ.get('WEEVIL_ENCODE_QUEUE_POLICY', 'drop-oldest')
+
+# Detection worker processes: 0 runs detection on a thread in the server
+# process; N > 0 starts N workers fed through shared-memory frame slots of
+# SLOT_BYTES each (must fit the largest camera frame). A worker that holds a
+# frame longer than JOB_TIMEOUT seconds is treated as hung and restarted
+DETECTOR_WORKERS = int(os.environ.get('WEEVIL_DETECTOR_WORKERS', 0))
+DETECTOR_SLOT_BYTES = int(os.environ.get('WEEVIL_DETECTOR_SLOT_BYTES', 1920 * 1080 * 3))
+DETECTOR_JOB_TIMEOUT = float(os.environ.get('WEEVIL_DETECTOR_JOB_TIMEOUT', 30))
+
+# Motion gate (see motion.py): when enabled, frames that barely differ from
+# the background skip detection. SENSITIVITY is the fraction of changed
+# pixels that counts as motion, PIXEL_THRESHOLD the grey-level change per
+# pixel; FORCE_SECONDS runs detection at least this often anyway.
+# SKIP_ENCODE also skips JPEG encoding of static frames
+MOTION_GATE = os.environ.get('WEEVIL_MOTION_GATE', '0') == '1'
+MOTION_SENSITIVITY = float(os.environ.get('WEEVIL_MOTION_SENSITIVITY', 0.002))
+MOTION_PIXEL_THRESHOLD = int(os.environ.get('WEEVIL_MOTION_PIXEL_THRESHOLD', 25))
+MOTION_FORCE_SECONDS = float(os.environ.get('WEEVIL_MOTION_FORCE_SECONDS', 10))
+MOTION_SKIP_ENCODE = os.environ.get('WEEVIL_MOTION_SKIP_ENCODE', '0') == '1'
+
+# Encoding tiers (see encoding.py): a tier is only encoded while a client
+# streams it or polled it within TIER_IDLE_SECONDS. ADAPTIVE lowers JPEG
+# quality when encoding exceeds BUDGET_MS per frame or clients fall behind
+ENCODE_ADAPTIVE = os.environ.get('WEEVIL_ENCODE_ADAPTIVE', '0') == '1'
+ENCODE_BUDGET_MS = float(os.environ.get('WEEVIL_ENCODE_BUDGET_MS', 20))
+TIER_IDLE_SECONDS = float(os.environ.get('WEEVIL_TIER_IDLE_SECONDS', 5))
+
+# /thumbnails: seconds a composited camera grid is reused, and the width of
+# each camera's cell (16:9)
+THUMBNAIL_MAX_AGE = float(os.environ.get('WEEVIL_THUMBNAIL_MAX_AGE', 3))
+THUMBNAIL_WIDTH = int(os.environ.get('WEEVIL_THUMBNAIL_WIDTH', 320))
+
+# Server-push events (/events): seconds between status heartbeats
+EVENT_HEARTBEAT_SECONDS = float(os.environ.get('WEEVIL_EVENT_HEARTBEAT_SECONDS', 10))
+
+# Detection history: SQLite database for /detections ('' disables it)
+DETECTION_DB = os.environ.get('WEEVIL_DETECTION_DB', 'detections.db')
+
+# Detection clips: directory for clips recorded around detections ('' disables
+# it). Each clip holds PRE_SECONDS before the first detection and runs until
+# POST_SECONDS after the last one (cut at MAX_SECONDS); the oldest clips are
+# deleted once the directory exceeds MAX_MB
+CLIP_DIR = os.environ.get('WEEVIL_CLIP_DIR', '')
+CLIP_PRE_SECONDS = float(os.environ.get('WEEVIL_CLIP_PRE_SECONDS', 5))
+CLIP_POST_SECONDS = float(os.environ.get('WEEVIL_CLIP_POST_SECONDS', 5))
+CLIP_MAX_SECONDS = float(os.environ.get('WEEVIL_CLIP_MAX_SECONDS', 60))
+CLIP_MAX_MB = float(os.environ.get('WEEVIL_CLIP_MAX_MB', 1024))
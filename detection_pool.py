@@ -0,0 +1,329 @@
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+from threading import Thread, Lock
+import multiprocessing as mp
+import itertools
+import queue
+import time
+import numpy as np
+from detectors import ActiveProducers, create_backend, ema
+
+def _attach_frame(shm, slot, slot_bytes, shape, dtype):
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=slot * slot_bytes)
+
+def _worker_main(backend_args, shm_name, slot_bytes, conn, max_batch, max_wait):
+    """Detection worker process: reads frames from shared memory slots"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    backend = create_backend(*backend_args)
+    try:
+        backend.load()
+    except Exception as e:
+        conn.send((None, None, repr(e), 0.0))
+        shm.close()
+        return
+    conn.send((None, None, None, 0.0))  # Job id None: this worker is ready
+    
+    stopping = False
+    while not stopping:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break  # The pool went away
+        if task is None:
+            break
+        
+        # Pick up whatever else is already waiting to form a batch, but no
+        # more frames than the parent expects to send this worker
+        batch = [task]
+        expected = min(max_batch, task[4])
+        deadline = time.monotonic() + max_wait
+        while len(batch) < expected:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not conn.poll(remaining):
+                break
+            task = conn.recv()
+            if task is None:
+                stopping = True  # Finish this batch, then stop
+                break
+            batch.append(task)
+        
+        frames = [_attach_frame(shm, slot, slot_bytes, shape, dtype)
+                  for _, slot, shape, dtype, _ in batch]
+        started = time.monotonic()
+        try:
+            detections = backend.detect_batch(frames)
+            seconds = time.monotonic() - started
+            for (job_id, *_), dets in zip(batch, detections):
+                conn.send((job_id, dets, None, seconds))
+        except Exception as e:
+            for job_id, *_ in batch:
+                conn.send((job_id, None, repr(e), 0.0))
+        del frames  # Release the views before closing the mapping
+    
+    shm.close()
+
+class WorkerHandle:
+    """Parent-side view of one worker: its process, its pipe and its jobs"""
+    __slots__ = ('index', 'process', 'conn', 'send_lock', 'ready', 'load_error', 'pending')
+    
+    def __init__(self, index, process, conn):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.send_lock = Lock()  # Camera threads submit concurrently
+        self.ready = False
+        self.load_error = None
+        self.pending = 0  # Jobs sent and not answered yet
+
+class ProcessDetectionPool:
+    def __init__(self, detector, backend_args, workers=2, slot_bytes=1920 * 1080 * 3,
+                 slots=None, max_batch=4, max_wait=0.02, max_restarts=3, job_timeout=30.0):
+        """
+        Run detection in worker processes, passing frames through shared memory
+        Args:
+            detector: WeevileDetector whose stats are updated with results
+            backend_args: Arguments for create_backend() in each worker
+            workers: Number of worker processes
+            slot_bytes: Size of one frame slot (largest frame accepted)
+            slots: Number of frame slots in the ring (default 2 per batch per worker)
+            max_batch, max_wait: Per-worker micro-batching limits
+            max_restarts: Crashed workers replaced before the pool gives up
+            job_timeout: Seconds a worker may hold a frame before it is
+                considered hung and killed
+        
+        Drop-in replacement for MicroBatcher: submit(frame) returns a Future.
+        Frames are copied once into a free slot of a shared-memory ring, and
+        only the slot index and shape cross the process boundary.
+        
+        Every worker has its own pipe and the parent picks the worker when it
+        submits a job, so a worker that dies (even mid-read) takes no shared
+        lock with it and the parent knows exactly which jobs to fail and
+        which slots to free.
+        """
+        self.detector = detector
+        self.backend_args = tuple(backend_args)
+        self.workers = workers
+        self.slot_bytes = slot_bytes
+        self.slots = slots or 2 * workers * max_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_restarts = max_restarts
+        self.job_timeout = job_timeout
+        self.restarts = 0
+        self.producers = ActiveProducers()
+        self.free_slots = queue.Queue()
+        self.jobs = {}  # job id -> (slot, Future, worker index, submit time)
+        self.lock = Lock()  # Guards jobs and handles
+        self.job_ids = itertools.count()
+        self.handles = []  # WorkerHandle per worker index, None once given up
+        self.shm = None
+        self.stopped = False
+        self.frames = 0
+        self.rejected = 0
+        self.load_error = None
+        self.inference_time = 0.0  # EMA of seconds per worker detect_batch call
+    
+    def start(self):
+        # Fork where available so the first workers don't re-import main.py;
+        # start the pool before camera threads exist. Replacements are
+        # spawned instead (see worker_exited)
+        ctx = mp.get_context('fork' if 'fork' in mp.get_all_start_methods() else None)
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slots * self.slot_bytes)
+        for slot in range(self.slots):
+            self.free_slots.put(slot)
+        self.handles = [self.spawn(ctx, index) for index in range(self.workers)]
+        
+        t = Thread(target=self.collect, args=())
+        t.daemon = True
+        t.start()
+        print(f"🧠 Detection pool started: {self.workers} workers, "
+              f"{self.slots} x {self.slot_bytes / 1024 / 1024:.1f}MB frame slots")
+        return self
+    
+    def spawn(self, ctx, index):
+        conn, child_conn = ctx.Pipe()
+        p = ctx.Process(target=_worker_main, args=(
+            self.backend_args, self.shm.name, self.slot_bytes,
+            child_conn, self.max_batch, self.max_wait))
+        p.daemon = True
+        p.start()
+        child_conn.close()  # The worker holds the only other end
+        return WorkerHandle(index, p, conn)
+    
+    @property
+    def ready_workers(self):
+        return sum(1 for h in self.handles if h is not None and h.ready)
+    
+    @property
+    def state(self):
+        """loading until a worker has its model, failed once no worker is left"""
+        if self.ready_workers > 0:
+            return 'ready'
+        if any(h is not None and h.load_error is None for h in self.handles):
+            return 'loading'
+        return 'failed' if self.load_error is not None else 'loading'
+    
+    def submit(self, frame, producer=None):
+        """Copy the frame into a free slot; the Future resolves to its detections"""
+        future = Future()
+        self.producers.touch(producer)
+        if self.state == 'failed':
+            future.set_exception(RuntimeError(f"Detection workers failed: {self.load_error}"))
+            return future
+        if frame.nbytes > self.slot_bytes:
+            future.set_exception(ValueError(
+                f"Frame of {frame.nbytes} bytes exceeds detection slot size {self.slot_bytes}"))
+            return future
+        try:
+            slot = self.free_slots.get(timeout=0.5)
+        except queue.Empty:
+            self.rejected += 1
+            future.set_exception(RuntimeError("No free detection frame slot"))
+            return future
+        
+        view = _attach_frame(self.shm, slot, self.slot_bytes, frame.shape, frame.dtype.str)
+        np.copyto(view, frame)
+        del view
+        
+        job_id = next(self.job_ids)
+        with self.lock:
+            # Least busy worker, preferring ones whose model is loaded
+            candidates = [h for h in self.handles if h is not None and h.load_error is None]
+            handle = min(candidates, key=lambda h: (not h.ready, h.pending), default=None)
+            if handle is not None:
+                handle.pending += 1
+                self.jobs[job_id] = (slot, future, handle.index, time.monotonic())
+                # Frames this worker can expect per batch if producers spread evenly
+                expected = -(-self.producers.count() // max(1, len(candidates)))
+        if handle is None:
+            self.free_slots.put(slot)
+            future.set_exception(RuntimeError("No detection worker available"))
+            return future
+        try:
+            with handle.send_lock:
+                handle.conn.send((job_id, slot, frame.shape, frame.dtype.str, expected))
+        except (OSError, ValueError):
+            pass  # Worker already gone; collect() fails the job with the others
+        return future
+    
+    def collect(self):
+        """Resolve futures as worker results come back; replace workers that die"""
+        next_check = 0.0
+        while not self.stopped:
+            with self.lock:
+                handles = [h for h in self.handles if h is not None]
+            waitables = {}
+            for h in handles:
+                waitables[h.conn] = h
+                waitables[h.process.sentinel] = h
+            if not waitables:
+                time.sleep(0.5)  # Every worker gave up; keep answering nothing
+                continue
+            for obj in wait(list(waitables), timeout=0.5):
+                h = waitables[obj]
+                if obj is h.conn:
+                    self.drain(h)
+                elif not self.stopped:
+                    self.worker_exited(h)
+            if time.monotonic() >= next_check:
+                next_check = time.monotonic() + 0.5
+                self.check_timeouts()
+    
+    def drain(self, handle):
+        """Handle every message waiting on one worker's pipe"""
+        try:
+            while handle.conn.poll():
+                job_id, detections, error, seconds = handle.conn.recv()
+                if job_id is None:
+                    # Worker start-up report: model loaded, or why it was not
+                    if error is None:
+                        handle.ready = True
+                    else:
+                        handle.load_error = self.load_error = error
+                        print(f"❌ Detection worker failed to load the model: {error}")
+                    continue
+                if seconds:
+                    self.inference_time = ema(self.inference_time, seconds)
+                self.resolve(job_id, detections, error)
+        except (EOFError, OSError):
+            pass  # Closed pipe; the process sentinel reports the exit
+    
+    def resolve(self, job_id, detections, error):
+        with self.lock:
+            job = self.jobs.pop(job_id, None)
+            if job is None:
+                return  # Already failed when its worker was given up on
+            slot, future, index, _ = job
+            handle = self.handles[index]
+            if handle is not None:
+                handle.pending -= 1
+        self.free_slots.put(slot)
+        if error is not None:
+            future.set_exception(RuntimeError(error))
+            return
+        self.detector.record([detections])
+        self.frames += 1
+        future.set_result(detections)
+    
+    def worker_exited(self, handle):
+        """Fail a dead worker's jobs, free their slots and replace it while restarts remain"""
+        self.drain(handle)  # Results (or a load error) sent before it exited
+        handle.process.join(timeout=1.0)
+        code = handle.process.exitcode
+        with self.lock:
+            lost = [(job_id, job) for job_id, job in self.jobs.items() if job[2] == handle.index]
+            for job_id, _ in lost:
+                del self.jobs[job_id]
+            self.handles[handle.index] = None
+        handle.conn.close()
+        for _, (slot, future, _, _) in lost:
+            self.free_slots.put(slot)
+            future.set_exception(RuntimeError(f"Detection worker {handle.index} exited"))
+        
+        if handle.load_error is not None:
+            return  # Reported why it could not load; restarting would not help
+        if self.restarts < self.max_restarts:
+            self.restarts += 1
+            print(f"⚠️  Detection worker {handle.index} exited (code {code}), "
+                  f"{len(lost)} jobs failed - restarting ({self.restarts}/{self.max_restarts})")
+            # The server has camera and HTTP threads by now, so forking it
+            # is not safe; a spawned worker starts from a clean interpreter
+            replacement = self.spawn(mp.get_context('spawn'), handle.index)
+            with self.lock:
+                self.handles[handle.index] = replacement
+        else:
+            print(f"❌ Detection worker {handle.index} exited (code {code}), {len(lost)} jobs failed")
+            if not any(self.handles):
+                self.load_error = f"all detection workers exited (last code {code})"
+    
+    def check_timeouts(self):
+        """Kill workers holding a frame longer than job_timeout; worker_exited() cleans up"""
+        now = time.monotonic()
+        with self.lock:
+            hung = {index for _, _, index, submitted in self.jobs.values()
+                    if now - submitted > self.job_timeout}
+            handles = [self.handles[index] for index in hung if self.handles[index] is not None]
+        for handle in handles:
+            if handle.process.is_alive():
+                print(f"⏱️  Detection worker {handle.index} held a frame over {self.job_timeout:.0f}s - killing it")
+                handle.process.kill()
+    
+    def stop(self):
+        self.stopped = True
+        handles = [h for h in self.handles if h is not None]
+        for h in handles:
+            try:
+                with h.send_lock:
+                    h.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for h in handles:
+            h.process.join(timeout=2.0)
+            if h.process.is_alive():
+                h.process.terminate()
+            h.conn.close()
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
@@ -0,0 +1,220 @@
+from contextlib import closing
+from datetime import datetime
+from threading import Thread
+import queue
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY,
+    camera TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    frame_seq INTEGER NOT NULL,
+    class_id INTEGER NOT NULL,
+    score REAL NOT NULL,
+    x1 INTEGER NOT NULL, y1 INTEGER NOT NULL,
+    x2 INTEGER NOT NULL, y2 INTEGER NOT NULL,
+    session INTEGER,
+    track_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS detections_camera_time ON detections (camera, timestamp, id);
+CREATE INDEX IF NOT EXISTS detections_time ON detections (timestamp, id);
+"""
+
+# Added after the first release; older databases get them with ALTER TABLE
+LATER_COLUMNS = {'session': 'INTEGER', 'track_id': 'INTEGER'}
+
+MAX_PAGE_SIZE = 1000
+
+class HistoryDisabled(Exception):
+    """Raised by the history endpoints when no detection store is configured"""
+
+def parse_time(value):
+    """Epoch seconds or an ISO 8601 date/time string -> epoch seconds (None passes through)"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+class DetectionStore:
+    def __init__(self, path, batch_size=256, flush_interval=1.0, max_pending=10000,
+                 min_track_hits=1):
+        """
+        Append-only detection log in SQLite (WAL mode)
+        Args:
+            path: Database file
+            batch_size: Rows written per transaction at most
+            flush_interval: Seconds a row may wait before being written
+            max_pending: Rows buffered before new ones are dropped
+            min_track_hits: Rows a track needs before daily counts include
+                it (the tracker's min_hits, so one-off false detections
+                are not counted as weevils)
+        
+        record() only enqueues; a background writer commits rows in
+        batches, so the detection path never waits on disk. Rows keep the
+        tracker's track_id together with a per-process session number
+        (track ids restart with the process), so daily counts can count
+        each weevil once.
+        """
+        self.path = path
+        self.session = int(time.time())
+        self.min_track_hits = min_track_hits
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.written = 0
+        self.dropped = 0
+        self.stopped = False
+    
+    def start(self):
+        """Create or migrate the database, then start the writer"""
+        with closing(self.connect()) as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+            columns = {row[1] for row in db.execute("PRAGMA table_info(detections)")}
+            for name, kind in LATER_COLUMNS.items():
+                if name not in columns:
+                    db.execute(f"ALTER TABLE detections ADD COLUMN {name} {kind}")
+        self.thread = Thread(target=self.run, args=())
+        self.thread.daemon = True
+        self.thread.start()
+        print(f"🗄️  Detection store writing to {self.path}")
+        return self
+    
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=5.0)
+        db.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL, far fewer fsyncs
+        return db
+    
+    def record(self, camera, frame_seq, timestamp, detections):
+        """Queue one row per detection box; never blocks"""
+        for det in detections:
+            x1, y1, x2, y2 = (int(v) for v in det.box)
+            try:
+                self.pending.put_nowait((camera, timestamp, frame_seq, int(det.class_id),
+                                         float(det.score), x1, y1, x2, y2,
+                                         self.session, det.track_id))
+            except queue.Full:
+                self.dropped += 1
+    
+    def listener(self, camera_id):
+        """DetectionScheduler listener that records one camera's detections"""
+        def on_result(seq, detections, latency):
+            if detections:
+                self.record(camera_id, seq, time.time(), detections)
+        return on_result
+    
+    def run(self):
+        db = self.connect()
+        while not (self.stopped and self.pending.empty()):
+            try:
+                rows = [self.pending.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while len(rows) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self.stopped:
+                    break
+                try:
+                    rows.append(self.pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                with db:
+                    db.executemany(
+                        "INSERT INTO detections (camera, timestamp, frame_seq, class_id, score,"
+                        " x1, y1, x2, y2, session, track_id)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self.written += len(rows)
+            except sqlite3.Error as e:
+                self.dropped += len(rows)
+                print(f"Detection store error: {e}")
+        db.close()
+    
+    def filters(self, since, until, camera):
+        """WHERE clauses and parameters shared by the read queries"""
+        where, params = [], []
+        if camera:
+            where.append("camera = ?")
+            params.append(camera)
+        if since is not None:
+            where.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("timestamp < ?")
+            params.append(until)
+        return where, params
+    
+    def query(self, since=None, until=None, camera=None, limit=100, cursor=None):
+        """
+        Page through detections in time order
+        Args:
+            since, until: Epoch seconds bounds (inclusive, exclusive)
+            camera: Only this camera
+            limit: Page size (1 to MAX_PAGE_SIZE)
+            cursor: next_cursor from the previous page
+        Returns:
+            (rows, next_cursor) where next_cursor is None on the last page
+        """
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+        where, params = self.filters(since, until, camera)
+        if cursor:
+            cursor_time, _, cursor_id = cursor.partition(':')
+            where.append("(timestamp, id) > (?, ?)")
+            params += [float(cursor_time), int(cursor_id)]
+        sql = ("SELECT id, camera, timestamp, frame_seq, class_id, score, x1, y1, x2, y2, track_id"
+               " FROM detections")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY timestamp, id LIMIT ?"
+        params.append(limit + 1)
+        
+        with closing(self.connect()) as db:
+            rows = db.execute(sql, params).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        results = [{
+            'id': r[0], 'camera': r[1], 'timestamp': r[2], 'frame_seq': r[3],
+            'class_id': r[4], 'score': round(r[5], 4), 'box': [r[6], r[7], r[8], r[9]],
+            'track_id': r[10]
+        } for r in rows]
+        next_cursor = f"{rows[-1][2]!r}:{rows[-1][0]}" if has_more else None
+        return results, next_cursor
+    
+    def daily_counts(self, since=None, until=None, camera=None):
+        """
+        Weevils per camera per (local) day
+        
+        count is the number of confirmed tracks (at least min_track_hits
+        rows), each on the day it was first seen, plus one per untracked
+        row (tracking off, or rows from before track ids were stored);
+        detections is the number of stored boxes.
+        """
+        where, params = self.filters(since, until, camera)
+        where = " WHERE " + " AND ".join(where) if where else ""
+        rows_sql = ("SELECT camera, date(timestamp, 'unixepoch', 'localtime') AS day, COUNT(*)"
+                    f" FROM detections{where} GROUP BY camera, day")
+        # One group per track, or per row when there is no track id
+        weevils_sql = ("SELECT camera, day, COUNT(*) FROM ("
+                       " SELECT camera, date(MIN(timestamp), 'unixepoch', 'localtime') AS day"
+                       f" FROM detections{where}"
+                       " GROUP BY camera, session, track_id, CASE WHEN track_id IS NULL THEN id END"
+                       " HAVING track_id IS NULL OR COUNT(*) >= ?"
+                       ") GROUP BY camera, day")
+        with closing(self.connect()) as db:
+            weevils = {(c, d): n for c, d, n in db.execute(weevils_sql, params + [self.min_track_hits])}
+            days = [{'camera': c, 'day': d, 'count': weevils.get((c, d), 0), 'detections': n}
+                    for c, d, n in db.execute(rows_sql, params)]
+        return sorted(days, key=lambda day: (day['day'], day['camera']))
+    
+    def stop(self):
+        """Flush what is queued and stop the writer"""
+        self.stopped = True
+        thread = getattr(self, 'thread', None)
+        if thread is not None:
+            thread.join(timeout=5.0)
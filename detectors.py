@@ -0,0 +1,515 @@
+from collections import namedtuple
+from concurrent.futures import Future
+from threading import Thread, Lock
+import queue
+import math
+import random
+import time
+import cv2
+import numpy as np
+
+class Detection(namedtuple('Detection', ['box', 'score', 'class_id', 'track_id'],
+                           defaults=(None,))):
+    """A single detection: box is (x1, y1, x2, y2) in frame pixels; track_id is set by a Tracker"""
+    __slots__ = ()
+    
+    def to_dict(self):
+        result = {
+            'box': [int(v) for v in self.box],
+            'score': round(float(self.score), 4),
+            'class_id': int(self.class_id)
+        }
+        if self.track_id is not None:
+            result['track_id'] = self.track_id
+        return result
+
+def nms(boxes, scores, iou_threshold=0.45, containment=None):
+    """
+    Greedy non-maximum suppression; returns kept indices, best score first
+    Args:
+        boxes: (N, 4) array of (x1, y1, x2, y2)
+        scores: (N,) confidences
+        iou_threshold: Suppress boxes overlapping a kept box by more than this
+        containment: Also suppress boxes whose own area lies more than this
+            fraction inside a kept box (fragments cut off at tile borders)
+    """
+    boxes = np.asarray(boxes, np.float32).reshape(-1, 4)
+    order = np.argsort(-np.asarray(scores, np.float32), kind='stable')
+    x1, y1, x2, y2 = boxes.T
+    areas = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    keep = []
+    while order.size:
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        inter = (np.clip(np.minimum(x2[best], x2[rest]) - np.maximum(x1[best], x1[rest]), 0, None) *
+                 np.clip(np.minimum(y2[best], y2[rest]) - np.maximum(y1[best], y1[rest]), 0, None))
+        suppress = inter > iou_threshold * np.maximum(areas[best] + areas[rest] - inter, 1e-6)
+        if containment is not None:
+            suppress |= inter > containment * np.maximum(areas[rest], 1e-6)
+        order = rest[~suppress]
+    return np.array(keep, dtype=int)
+
+class DetectorBackend:
+    """
+    Detector plugin interface
+    
+    Backends are loaded once at startup and then receive lists of BGR frames;
+    detect_batch returns one list of Detection per input frame.
+    """
+    name = 'base'
+    
+    def load(self):
+        """Load model weights (called once before the first batch)"""
+    
+    def detect_batch(self, frames):
+        raise NotImplementedError
+
+class DemoBackend(DetectorBackend):
+    """Placeholder backend - randomly 'detects' weevils for demos"""
+    name = 'demo'
+    
+    def __init__(self, threshold=0.8):
+        self.threshold = threshold  # 0.8 = 20% chance of detection
+    
+    def detect_batch(self, frames):
+        results = []
+        for frame in frames:
+            score = random.random()
+            if score > self.threshold:
+                results.append([Detection((10, 50, 200, 100), score, 0)])
+            else:
+                results.append([])
+        return results
+
+class OnnxBackend(DetectorBackend):
+    """
+    CPU inference through OpenCV DNN for YOLO-style ONNX exports
+    
+    Handles both the YOLOv5 layout (N, anchors, 5 + classes) and the
+    YOLOv8 layout (N, 4 + classes, anchors). Export the model with a dynamic
+    batch axis to get real batching; fixed batch-1 models fall back to one
+    forward pass per frame.
+    """
+    name = 'onnx'
+    
+    def __init__(self, model_path, input_size=640, confidence=0.25, nms_threshold=0.45):
+        self.model_path = model_path
+        self.input_size = input_size
+        self.confidence = confidence
+        self.nms_threshold = nms_threshold
+        self.net = None
+        self.batching = True
+    
+    def load(self):
+        self.net = cv2.dnn.readNetFromONNX(self.model_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        print(f"🧠 Loaded ONNX detector: {self.model_path}")
+    
+    def detect_batch(self, frames):
+        if not self.batching and len(frames) > 1:
+            return [self._forward([frame])[0] for frame in frames]
+        try:
+            return self._forward(frames)
+        except cv2.error:
+            if len(frames) == 1:
+                raise
+            print("⚠️  Model does not accept batched input - falling back to batch size 1")
+            self.batching = False
+            return [self._forward([frame])[0] for frame in frames]
+    
+    def _forward(self, frames):
+        size = (self.input_size, self.input_size)
+        blob = cv2.dnn.blobFromImages(frames, 1 / 255.0, size, swapRB=True, crop=False)
+        self.net.setInput(blob)
+        output = self.net.forward()
+        if output.ndim == 2:
+            output = output[np.newaxis]
+        return [self._parse(pred, frame.shape) for pred, frame in zip(output, frames)]
+    
+    def _parse(self, pred, shape):
+        # YOLOv8 outputs (4 + classes, anchors); transpose to (anchors, ...)
+        if pred.shape[0] < pred.shape[1]:
+            pred = pred.T
+            boxes, class_scores = pred[:, :4], pred[:, 4:]
+        else:
+            boxes, class_scores = pred[:, :4], pred[:, 5:] * pred[:, 4:5]
+        
+        class_ids = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(class_ids)), class_ids]
+        keep = scores >= self.confidence
+        if not keep.any():
+            return []
+        boxes, scores, class_ids = boxes[keep], scores[keep], class_ids[keep]
+        
+        # Centre-size boxes in network space -> corner boxes in frame pixels
+        height, width = shape[:2]
+        sx, sy = width / self.input_size, height / self.input_size
+        x1 = (boxes[:, 0] - boxes[:, 2] / 2) * sx
+        y1 = (boxes[:, 1] - boxes[:, 3] / 2) * sy
+        w = boxes[:, 2] * sx
+        h = boxes[:, 3] * sy
+        rects = np.stack([x1, y1, w, h], axis=1)
+        
+        indices = cv2.dnn.NMSBoxes(rects.tolist(), scores.tolist(),
+                                   self.confidence, self.nms_threshold)
+        detections = []
+        for i in np.array(indices).flatten():
+            x, y, bw, bh = rects[i]
+            box = (max(0, int(x)), max(0, int(y)),
+                   min(width - 1, int(x + bw)), min(height - 1, int(y + bh)))
+            detections.append(Detection(box, float(scores[i]), int(class_ids[i])))
+        return detections
+
+class TiledBackend(DetectorBackend):
+    """
+    Run another backend on overlapping tiles of each frame
+    
+    A weevil is a few dozen pixels in a 1280x720 frame and vanishes when the
+    whole frame is shrunk to the network input. Tiles of input_size pixels
+    are inferred at native resolution instead, plus (optionally) the whole
+    frame downscaled for large objects. All tiles of all frames in a batch
+    go to the wrapped backend in one call, so per-frame cost is fixed by the
+    tile count. Boxes are shifted back to frame pixels and merged per class
+    with NMS, which also drops fragments cut off at tile borders.
+    """
+    name = 'tiled'
+    
+    def __init__(self, backend, tile_size=640, overlap=0.2, full_frame=True,
+                 nms_threshold=0.45, containment=0.7):
+        self.backend = backend
+        self.tile_size = tile_size
+        self.overlap = min(max(overlap, 0.0), 0.9)
+        self.full_frame = full_frame
+        self.nms_threshold = nms_threshold
+        self.containment = containment
+        self.layouts = {}  # (height, width) -> [(x, y, w, h), ...]
+    
+    def load(self):
+        self.backend.load()
+    
+    def tiles(self, shape):
+        """Tile rectangles covering a frame of this shape (cached per size)"""
+        height, width = shape[:2]
+        layout = self.layouts.get((height, width))
+        if layout is None:
+            xs, ws = self._positions(width)
+            ys, hs = self._positions(height)
+            layout = [(x, y, ws, hs) for y in ys for x in xs]
+            if self.full_frame and len(layout) > 1:
+                layout.insert(0, (0, 0, width, height))
+            self.layouts[(height, width)] = layout
+        return layout
+    
+    def _positions(self, length):
+        # Evenly spaced tile offsets along one axis; the last tile ends flush
+        if length <= self.tile_size:
+            return [0], length
+        step = self.tile_size * (1 - self.overlap)
+        count = math.ceil((length - self.tile_size) / step) + 1
+        return [int(round(p)) for p in np.linspace(0, length - self.tile_size, count)], self.tile_size
+    
+    def detect_batch(self, frames):
+        crops, owners = [], []
+        for index, frame in enumerate(frames):
+            for x, y, w, h in self.tiles(frame.shape):
+                crops.append(frame[y:y + h, x:x + w])
+                owners.append((index, x, y))
+        
+        found = [[] for _ in frames]
+        for (index, x, y), detections in zip(owners, self.backend.detect_batch(crops)):
+            found[index].extend(Detection((d.box[0] + x, d.box[1] + y, d.box[2] + x, d.box[3] + y),
+                                          d.score, d.class_id) for d in detections)
+        return [self.merge(detections) for detections in found]
+    
+    def merge(self, detections):
+        """Drop duplicates seen by overlapping tiles"""
+        if len(detections) < 2:
+            return detections
+        boxes = np.array([d.box for d in detections], np.float32)
+        class_ids = np.array([d.class_id for d in detections], np.float32)
+        # Shift each class to its own region so one NMS pass never mixes classes
+        boxes += (class_ids * (boxes.max() + 1))[:, np.newaxis]
+        keep = nms(boxes, [d.score for d in detections], self.nms_threshold, self.containment)
+        return [detections[i] for i in keep]
+
+def create_backend(model_path='', input_size=640, confidence=0.25, nms_threshold=0.45,
+                   tiling=False, tile_overlap=0.2, tile_full_frame=True):
+    """Pick a backend from the configured model path, optionally tiled"""
+    if model_path and model_path.lower().endswith('.onnx'):
+        backend = OnnxBackend(model_path, input_size, confidence, nms_threshold)
+    elif model_path:
+        raise ValueError(f"Unsupported detector model: {model_path}")
+    else:
+        backend = DemoBackend()
+    if tiling:
+        backend = TiledBackend(backend, input_size, tile_overlap, tile_full_frame, nms_threshold)
+    return backend
+
+class WeevileDetector:
+    def __init__(self, backend=None):
+        self.backend = backend or DemoBackend()
+        self.loaded = False
+        self.last_detection = False
+        self.last_detections = []
+        self.detection_count = 0
+        self.stats_lock = Lock()
+    
+    def load(self):
+        """Load the backend once; later calls are no-ops"""
+        if not self.loaded:
+            self.backend.load()
+            self.loaded = True
+        return self
+    
+    def detect_batch(self, frames):
+        """Run the backend on a batch of frames and update detection stats"""
+        self.load()
+        results = self.backend.detect_batch(frames)
+        self.record(results)
+        return results
+    
+    def record(self, results):
+        """Update detection stats from per-frame results"""
+        with self.stats_lock:
+            for detections in results:
+                self.last_detections = detections
+                self.last_detection = bool(detections)
+                if detections:
+                    self.detection_count += 1
+    
+    def detect_weevil(self, frame):
+        """Single-frame convenience wrapper returning (detected, message)"""
+        detections = self.detect_batch([frame])[0]
+        if detections:
+            return True, "Red Weevil Detected!"
+        return False, "No Weevils Detected"
+
+def ema(average, value, weight=0.2):
+    """Exponential moving average that starts at the first value"""
+    return value if not average else (1 - weight) * average + weight * value
+
+class ActiveProducers:
+    def __init__(self, window=2.0):
+        """
+        Producers (detection schedulers) that submitted a frame recently
+        Args:
+            window: Seconds after its last frame that a producer still counts
+        
+        Every scheduler keeps at most one frame in flight, so a batch can
+        never hold more frames than there are active producers; waiting for
+        more only adds latency.
+        """
+        self.window = window
+        self.seen = {}
+        self.lock = Lock()
+    
+    def touch(self, producer):
+        with self.lock:
+            self.seen[producer] = time.monotonic()
+    
+    def count(self):
+        cutoff = time.monotonic() - self.window
+        with self.lock:
+            self.seen = {p: t for p, t in self.seen.items() if t >= cutoff}
+            return max(1, len(self.seen))
+
+class MicroBatcher:
+    def __init__(self, detector, max_batch=4, max_wait=0.02):
+        """
+        Group frames from many producers into batched detector calls
+        Args:
+            detector: WeevileDetector to run batches on
+            max_batch: Largest number of frames per inference call
+            max_wait: Seconds to wait for a batch to fill after its first frame
+        
+        The model is loaded on the batcher thread, so start() returns at once;
+        `state` reports loading / ready / failed. A batch is flushed as soon
+        as every active producer has a frame in it, so a single camera never
+        waits max_wait for frames that cannot come.
+        """
+        self.detector = detector
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.producers = ActiveProducers()
+        self.pending = queue.Queue()
+        self.stopped = False
+        self.load_error = None
+        self.batches = 0
+        self.frames = 0
+        self.inference_time = 0.0  # EMA of seconds per detect_batch call
+    
+    def start(self):
+        t = Thread(target=self.run, args=())
+        t.daemon = True
+        t.start()
+        print("🧺 Detection micro-batcher started")
+        return self
+    
+    @property
+    def state(self):
+        if self.detector.loaded:
+            return 'ready'
+        return 'failed' if self.load_error is not None else 'loading'
+    
+    def submit(self, frame, producer=None):
+        """Queue a copy of the frame; the Future resolves to its detections"""
+        future = Future()
+        self.producers.touch(producer)
+        self.pending.put((frame.copy(), future))
+        return future
+    
+    def run(self):
+        try:
+            self.detector.load()
+        except Exception as e:
+            # Batches keep retrying the load and fail their futures meanwhile
+            self.load_error = str(e)
+            print(f"❌ Detector failed to load: {e}")
+        while not self.stopped:
+            try:
+                batch = [self.pending.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            
+            # Fill the batch until every producer is in it or the deadline passes
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < min(self.max_batch, self.producers.count()):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            frames = [frame for frame, _ in batch]
+            started = time.monotonic()
+            try:
+                results = self.detector.detect_batch(frames)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.inference_time = ema(self.inference_time, time.monotonic() - started)
+            for (_, future), detections in zip(batch, results):
+                future.set_result(detections)
+            self.batches += 1
+            self.frames += len(batch)
+    
+    def stop(self):
+        self.stopped = True
+
+class DetectionScheduler:
+    def __init__(self, batcher, stride=1, adaptive=False, tracker=None, track_stride=1):
+        """
+        Decide which displayed frames go to the detector
+        Args:
+            batcher: MicroBatcher that runs the detections
+            stride: Run detection on every Nth frame
+            adaptive: Derive the stride from the batcher's measured inference
+                time (not the submit-to-result latency, which includes queueing
+                and batching waits)
+            tracker: Tracker that links results into tracks; detection_count
+                then counts unique weevils instead of frames with a weevil
+            track_stride: Stride used while the tracker is steady (every
+                track confirmed and matched), as boxes are propagated between
+                inference frames
+        
+        At most one frame is in flight per scheduler, so a slow detector
+        skips frames instead of queueing them, and the display path always
+        overlays the most recent finished result.
+        """
+        self.batcher = batcher
+        self.stride = max(1, stride)
+        self.adaptive = adaptive
+        self.tracker = tracker
+        self.track_stride = max(1, track_stride)
+        self.lock = Lock()
+        self.in_flight = False
+        self.frames_since = self.stride  # Detect on the very first frame
+        self.latency = 0.0          # EMA of submit-to-result seconds
+        self.frame_interval = 0.0   # EMA of seconds between offered frames
+        self.last_offer = 0.0
+        self.result_seq = 0
+        self.result_time = 0.0
+        self.detections = []
+        self.detection_count = 0
+        self.submitted = 0
+        self.skipped = 0
+        self.listeners = []  # Called as listener(seq, detections, latency_seconds)
+    
+    def offer(self, seq, frame):
+        """
+        Submit the frame for detection if the policy allows; never blocks
+        Args:
+            seq: Capture sequence number of the frame
+            frame: BGR frame, or a zero-argument callable returning one so
+                frames that are skipped are never decoded
+        """
+        now = time.monotonic()
+        with self.lock:
+            if self.last_offer:
+                interval = now - self.last_offer
+                self.frame_interval = interval if not self.frame_interval else (
+                    0.9 * self.frame_interval + 0.1 * interval)
+            self.last_offer = now
+            self.frames_since += 1
+            
+            if self.adaptive and self.frame_interval > 0:
+                self.stride = max(1, round(self.batcher.inference_time / self.frame_interval))
+            stride = self.stride
+            if self.tracker is not None and self.tracker.steady():
+                stride = max(stride, self.track_stride)
+            if self.in_flight or self.frames_since < stride:
+                self.skipped += 1
+                return False
+            self.in_flight = True
+            self.frames_since = 0
+            self.submitted += 1
+        
+        # Executors copy the frame, so the caller may keep drawing on it
+        if callable(frame):
+            frame = frame()
+        future = self.batcher.submit(frame, producer=self)
+        future.add_done_callback(lambda f: self._finish(f, seq, now))
+        return True
+    
+    def _finish(self, future, seq, submitted_at):
+        latency = time.monotonic() - submitted_at
+        with self.lock:
+            self.in_flight = False
+            self.latency = ema(self.latency, latency)
+            if future.exception() is not None:
+                print(f"Detection error: {future.exception()}")
+                return
+            self.detections = future.result()
+            if self.tracker is not None:
+                self.detections = self.tracker.update(self.detections, submitted_at)
+                self.detection_count = self.tracker.unique_count
+            elif self.detections:
+                self.detection_count += 1
+            self.result_seq = seq
+            self.result_time = time.time()
+            detections = self.detections
+        for listener in self.listeners:
+            try:
+                listener(seq, detections, latency)
+            except Exception as e:
+                print(f"Detection listener error: {e}")
+    
+    def add_listener(self, listener):
+        """Register listener(seq, detections, latency) for every finished detection"""
+        self.listeners.append(listener)
+    
+    def latest(self):
+        """Return (seq, detections) of the most recent finished detection"""
+        with self.lock:
+            return self.result_seq, self.detections
+    
+    def current(self):
+        """Detections to draw on the frame shown now: tracks moved to the present, or the latest result"""
+        with self.lock:
+            if self.tracker is None:
+                return self.detections
+            return self.tracker.predict(time.monotonic())
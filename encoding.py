@@ -0,0 +1,79 @@
+import time
+import cv2
+
+# Encoding tiers, largest first: width None keeps the capture resolution,
+# smaller tiers keep the aspect ratio
+TIERS = {
+    'full': {'width': None, 'quality': 80, 'optimize': True},
+    'medium': {'width': 640, 'quality': 70, 'optimize': False},
+    'thumb': {'width': 320, 'quality': 60, 'optimize': False},
+}
+DEFAULT_TIER = 'full'
+
+class TierEncoder:
+    def __init__(self, name, width=None, quality=80, optimize=False,
+                 adaptive=False, budget_ms=20.0, min_quality=40):
+        """
+        JPEG encoder for one resolution tier
+        Args:
+            name: Tier name used in ?tier= query parameters
+            width: Target width in pixels (None = source resolution)
+            quality: JPEG quality (the ceiling in adaptive mode)
+            optimize: Enable IMWRITE_JPEG_OPTIMIZE (smaller but slower)
+            adaptive: Lower quality when encoding or clients fall behind
+            budget_ms: Encode time budget per frame for adaptive mode
+            min_quality: Adaptive mode never goes below this quality
+        """
+        self.name = name
+        self.width = width
+        self.max_quality = quality
+        self.quality = quality
+        self.optimize = optimize
+        self.adaptive = adaptive
+        self.budget_ms = budget_ms
+        self.min_quality = min_quality
+        self.encode_ms = 0.0  # EMA of encode time
+        self.last_backlog = 0
+    
+    def scale(self, frame):
+        """Resize the frame to this tier (no-op when it is already small enough)"""
+        if self.width is None or frame.shape[1] <= self.width:
+            return frame
+        height = round(frame.shape[0] * self.width / frame.shape[1])
+        return cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+    
+    def encode(self, frame, backlog=0):
+        """
+        Encode an already scaled frame
+        Args:
+            frame: BGR frame at this tier's resolution
+            backlog: Running count of frames dropped by this tier's clients
+        Returns:
+            JPEG as a memoryview over the encoder's buffer (no bytes copy),
+            or None if encoding failed
+        """
+        start = time.perf_counter()
+        params = [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+        if self.optimize:
+            params += [cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+        ret, buffer = cv2.imencode('.jpg', frame, params)
+        elapsed = (time.perf_counter() - start) * 1000
+        self.encode_ms = elapsed if not self.encode_ms else 0.9 * self.encode_ms + 0.1 * elapsed
+        
+        if self.adaptive:
+            self.adapt(backlog)
+        return memoryview(buffer.reshape(-1)) if ret else None
+    
+    def adapt(self, backlog):
+        """Step quality down when over budget or clients drop frames, back up when idle"""
+        behind = backlog > self.last_backlog
+        self.last_backlog = backlog
+        if behind or self.encode_ms > self.budget_ms:
+            self.quality = max(self.min_quality, self.quality - 5)
+        elif self.encode_ms < self.budget_ms * 0.5:
+            self.quality = min(self.max_quality, self.quality + 1)
+
+def create_encoders(adaptive=False, budget_ms=20.0):
+    """One TierEncoder per configured tier, largest first"""
+    return {name: TierEncoder(name, adaptive=adaptive, budget_ms=budget_ms, **tier)
+            for name, tier in TIERS.items()}
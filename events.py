@@ -0,0 +1,145 @@
+from collections import deque
+from threading import Thread, Condition
+import json
+import time
+
+class EventBus:
+    def __init__(self, history=256, boot_id=None):
+        """
+        Server-push event channel (Server-Sent Events)
+        Args:
+            history: Number of recent events kept for reconnecting clients
+            boot_id: Prefix of every event id, unique per process start
+        
+        Each event is formatted once when published; subscribers read from
+        the shared history by event id, so a reconnecting client can resume
+        with Last-Event-ID and a slow one never holds up the publisher.
+        Event ids read "<boot_id>-<n>": an id from an earlier process (or one
+        this process never issued) is not trusted, see resume_point().
+        """
+        self.boot_id = boot_id or format(int(time.time()), 'x')
+        self.changed = Condition()
+        self.history = deque(maxlen=history)  # (id, formatted bytes)
+        self.last_id = 0
+        self.subscribers = 0
+        self.listeners = []  # Called with no arguments after every publish
+        self.closed = False
+    
+    def publish(self, event_type, data):
+        """Format the event once and wake every subscriber"""
+        with self.changed:
+            self.last_id += 1
+            message = (f"id: {self.boot_id}-{self.last_id}\n"
+                       f"event: {event_type}\n"
+                       f"data: {json.dumps(data, separators=(',', ':'))}\n\n").encode()
+            self.history.append((self.last_id, message))
+            self.changed.notify_all()
+        for listener in self.listeners:
+            listener()
+    
+    def add_listener(self, listener):
+        """Call listener() from the publishing thread after every event"""
+        self.listeners.append(listener)
+    
+    def subscribe(self):
+        """Register a client; returns the id new clients should resume after"""
+        with self.changed:
+            self.subscribers += 1
+            return self.last_id
+    
+    def resume_point(self, last_event_id):
+        """
+        Event number to resume after for a client's Last-Event-ID header
+        
+        Ids from a previous boot resume from the start of this boot's
+        history (the client missed all of it); malformed ids, or ids newer
+        than anything published, resume from now.
+        """
+        with self.changed:
+            boot, _, number = (last_event_id or '').rpartition('-')
+            if not number.isdigit():
+                return self.last_id
+            if boot != self.boot_id:
+                return 0
+            return min(int(number), self.last_id)
+    
+    def unsubscribe(self):
+        with self.changed:
+            self.subscribers -= 1
+    
+    def since(self, last_id):
+        """Formatted events newer than last_id that are still in the history"""
+        with self.changed:
+            return [(i, m) for i, m in self.history if i > last_id]
+    
+    def wait(self, last_id, timeout=None):
+        """Block until events newer than last_id exist; returns them (may be empty)"""
+        with self.changed:
+            self.changed.wait_for(lambda: self.closed or self.last_id > last_id, timeout)
+        return self.since(last_id)
+    
+    def stream(self, last_id=None, timeout=15.0):
+        """
+        Generator of SSE messages for one client
+        Args:
+            last_id: Client's Last-Event-ID header (None = only new events)
+            timeout: Send a comment line this often so proxies keep the connection
+        """
+        current_id = self.subscribe()
+        last_id = current_id if last_id is None else self.resume_point(last_id)
+        try:
+            yield b"retry: 3000\n\n"
+            while not self.closed:
+                events = self.wait(last_id, timeout)
+                if not events:
+                    yield b": keep-alive\n\n"
+                    continue
+                for last_id, message in events:
+                    yield message
+        finally:
+            self.unsubscribe()
+    
+    def start_heartbeat(self, interval, payload):
+        """Publish a 'heartbeat' event carrying payload() every interval seconds"""
+        def run():
+            while not self.closed:
+                time.sleep(interval)
+                try:
+                    self.publish('heartbeat', payload())
+                except Exception as e:
+                    print(f"Heartbeat error: {e}")
+        t = Thread(target=run, args=())
+        t.daemon = True
+        t.start()
+        return self
+    
+    def close(self):
+        with self.changed:
+            self.closed = True
+            self.changed.notify_all()
+
+class DetectionEventPublisher:
+    def __init__(self, bus, camera_id, scheduler):
+        """
+        DetectionScheduler listener that pushes results for one camera
+        
+        Every result with detections becomes a 'detection' event; the first
+        empty result after one becomes a 'clear' event. Quiet frames
+        produce no traffic.
+        """
+        self.bus = bus
+        self.camera_id = camera_id
+        self.scheduler = scheduler
+        self.detected = False
+    
+    def __call__(self, seq, detections, latency):
+        if not detections and not self.detected:
+            return
+        self.detected = bool(detections)
+        self.bus.publish('detection' if detections else 'clear', {
+            'camera': self.camera_id,
+            'frame_seq': seq,
+            'timestamp': time.time(),
+            'detections': [det.to_dict() for det in detections],
+            'detection_count': self.scheduler.detection_count
+        })
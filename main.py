@@ -1,37 +1,18 @@
-from flask import Flask, Response, render_template, jsonify
+from flask import Flask, Response, render_template, jsonify, request, abort
 from flask_cors import CORS, cross_origin
-import cv2
-from threading import Thread
 import time
-import random
 import json
-from videostream import VideoStream
-try:
-    import psutil
-    PSUTIL_AVAILABLE = True
-except ImportError:
-    PSUTIL_AVAILABLE = False
-    print("⚠️  psutil not available - memory monitoring disabled")
-import gc
-
-class WeevileDetector:
-    def __init__(self):
-        self.last_detection = False
-        self.detection_count = 0
-        
-    def detect_weevil(self, frame):
-        # Placeholder detection logic - replace with your actual model
-        # For demo purposes, randomly detect weevils
-        detection_probability = random.random()
-        
-        # Simulate detection based on some criteria (for demo)
-        if detection_probability > 0.8:  # 20% chance of detection
-            self.last_detection = True
-            self.detection_count += 1
-            return True, "Red Weevil Detected!"
-        else:
-            self.last_detection = False
-            return False, "No Weevils Detected"
+import math
+from cameras import CameraRegistry, parse_sources, get_memory_usage, PSUTIL_AVAILABLE
+from metrics import render_prometheus
+from events import EventBus, DetectionEventPublisher
+from detection_store import DetectionStore, HistoryDisabled, MAX_PAGE_SIZE, parse_time
+from recorder import ClipRecorder
+from thumbnails import ThumbnailGrid
+from detectors import WeevileDetector, MicroBatcher, create_backend
+from detection_pool import ProcessDetectionPool
+from encoding import TIERS, DEFAULT_TIER
+import config
 
 app = Flask(__name__)
 
@@ -52,158 +33,399 @@ def after_request(response):
     response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     response.headers.add('Access-Control-Allow-Credentials', 'true')
+    response.headers.add('Access-Control-Expose-Headers', 'ETag,X-Frame-Seq,X-Overlay')
     return response
 
-# Initialize video stream and detector
-vs = VideoStream(src=0).start()  # start threaded camera feed
-detector = WeevileDetector()
-
-# Global variables for frame processing
-current_processed_frame = None
-last_frame_time = 0
-frame_lock = Thread()
-frame_count = 0
-memory_check_interval = 100  # Check memory every 100 frames
-
-def get_memory_usage():
-    """Get current memory usage in MB"""
-    if PSUTIL_AVAILABLE:
-        process = psutil.Process()
-        return process.memory_info().rss / 1024 / 1024
-    return 0
-
-def process_frame_continuously():
-    """Continuously process frames in a separate thread"""
-    global current_processed_frame, last_frame_time, frame_count
-    
-    while True:
-        try:
-            # Get frame from video stream
-            frame = vs.read()
-            if frame is None:
-                time.sleep(0.01)  # Small delay if no frame
-                continue
-                
-            # Run detection on frame
-            detected, message = detector.detect_weevil(frame)
-            
-            # Add detection overlay to frame
-            if detected:
-                cv2.putText(frame, "WEEVIL DETECTED!", (10, 30), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-                cv2.rectangle(frame, (10, 50), (200, 100), (0, 0, 255), 2)
-            else:
-                cv2.putText(frame, "Monitoring...", (10, 30), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-            
-            # Encode frame as JPEG with optimized settings
-            ret, buffer = cv2.imencode('.jpg', frame, [
-                cv2.IMWRITE_JPEG_QUALITY, 80,  # Slightly lower quality for smaller size
-                cv2.IMWRITE_JPEG_OPTIMIZE, 1   # Enable optimization
-            ])
-            
-            if ret:
-                # Replace old frame (automatic cleanup)
-                current_processed_frame = buffer.tobytes()
-                last_frame_time = time.time()
-                frame_count += 1
-                
-                # Periodic memory monitoring and cleanup
-                if frame_count % memory_check_interval == 0:
-                    if PSUTIL_AVAILABLE:
-                        memory_mb = get_memory_usage()
-                        if memory_mb > 500:  # If using more than 500MB
-                            print(f"⚠️  High memory usage: {memory_mb:.1f}MB - Running garbage collection")
-                            gc.collect()  # Force garbage collection
-                        elif frame_count % (memory_check_interval * 10) == 0:  # Every 1000 frames
-                            print(f"📊 Memory usage: {memory_mb:.1f}MB, Frames processed: {frame_count}")
-                    else:
-                        # Just run garbage collection periodically without monitoring
-                        if frame_count % (memory_check_interval * 5) == 0:  # Every 500 frames
-                            gc.collect()
-                            print(f"🧹 Garbage collection run, Frames processed: {frame_count}")
-            
-            # Control frame processing rate (30 FPS max)
-            time.sleep(1/30)
-            
-        except Exception as e:
-            print(f"Frame processing error: {e}")
-            time.sleep(0.1)
-
-def generate_frames():
-    """Generator for video streaming"""
-    global current_processed_frame
-    
-    while True:
-        if current_processed_frame is not None:
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + current_processed_frame + b'\r\n')
-        time.sleep(1/60)  # 60 FPS streaming
+# Initialize detector and cameras. Importing this module only builds the
+# objects; start() launches the threads, worker processes, history writer
+# and clip recorders. Nothing there blocks either: the model loads on the
+# batcher thread (or in the worker processes) and cameras are opened in the
+# background, so the server is up immediately and endpoints answer
+# 503 + Retry-After until their camera is warm
+backend_args = (config.DETECTOR_MODEL, config.DETECTOR_INPUT_SIZE,
+                config.DETECTOR_CONFIDENCE, config.DETECTOR_NMS_THRESHOLD,
+                config.DETECTOR_TILING, config.DETECTOR_TILE_OVERLAP,
+                config.DETECTOR_TILE_FULL_FRAME)
+detector = WeevileDetector(create_backend(*backend_args))
+if config.DETECTOR_WORKERS > 0:
+    # Workers load their own model copy; start() starts the pool before any
+    # camera is opened so forked workers inherit no capture state
+    batcher = ProcessDetectionPool(detector, backend_args, workers=config.DETECTOR_WORKERS,
+                                   slot_bytes=config.DETECTOR_SLOT_BYTES,
+                                   max_batch=config.DETECTOR_MAX_BATCH,
+                                   max_wait=config.DETECTOR_BATCH_WAIT_MS / 1000,
+                                   job_timeout=config.DETECTOR_JOB_TIMEOUT)
+else:
+    batcher = MicroBatcher(detector, max_batch=config.DETECTOR_MAX_BATCH,
+                           max_wait=config.DETECTOR_BATCH_WAIT_MS / 1000)
+registry = CameraRegistry(batcher, stride=config.DETECTION_STRIDE,
+                          adaptive=config.DETECTION_ADAPTIVE,
+                          encode_adaptive=config.ENCODE_ADAPTIVE,
+                          encode_budget_ms=config.ENCODE_BUDGET_MS,
+                          tier_idle_seconds=config.TIER_IDLE_SECONDS,
+                          motion={'sensitivity': config.MOTION_SENSITIVITY,
+                                  'pixel_threshold': config.MOTION_PIXEL_THRESHOLD,
+                                  'force_seconds': config.MOTION_FORCE_SECONDS}
+                                 if config.MOTION_GATE else None,
+                          motion_skip_encode=config.MOTION_SKIP_ENCODE,
+                          capture={'backend': config.CAPTURE_BACKEND,
+                                   'fourcc': config.CAPTURE_FOURCC or None,
+                                   'width': config.CAPTURE_WIDTH,
+                                   'height': config.CAPTURE_HEIGHT,
+                                   'passthrough': config.CAPTURE_PASSTHROUGH,
+                                   'stall_timeout': config.CAPTURE_STALL_SECONDS,
+                                   'max_backoff': config.CAPTURE_MAX_BACKOFF},
+                          negotiate=config.CAPTURE_NEGOTIATE,
+                          # Tiles need the full-resolution frame, not just the detector input
+                          min_capture_width=(config.CAPTURE_WIDTH if config.DETECTOR_TILING
+                                             else config.DETECTOR_INPUT_SIZE),
+                          capture_queue=(config.CAPTURE_QUEUE_SIZE, config.CAPTURE_QUEUE_POLICY),
+                          encode_queue=(config.ENCODE_QUEUE_SIZE, config.ENCODE_QUEUE_POLICY),
+                          tracking={'iou_threshold': config.TRACK_IOU,
+                                    'min_hits': config.TRACK_MIN_HITS,
+                                    'max_age': config.TRACK_MAX_AGE}
+                                   if config.TRACKING else None,
+                          track_stride=config.TRACK_STRIDE,
+                          overlay=config.OVERLAY)
+boot_id = format(int(time.time()), 'x')  # Keeps ETags and event ids unique across restarts
+events = EventBus(boot_id=boot_id)  # detection events + status heartbeats for /events
+store = (DetectionStore(config.DETECTION_DB, min_track_hits=config.TRACK_MIN_HITS)
+         if config.DETECTION_DB else None)
+for camera_id, src in parse_sources(config.CAMERAS):
+    pipeline = registry.add(camera_id, src)
+    pipeline.scheduler.add_listener(DetectionEventPublisher(events, camera_id, pipeline.scheduler))
+    if store is not None:
+        pipeline.scheduler.add_listener(store.listener(camera_id))
+
+thumbnails = ThumbnailGrid(registry, max_age=config.THUMBNAIL_MAX_AGE,
+                           cell_width=config.THUMBNAIL_WIDTH,
+                           cell_height=config.THUMBNAIL_WIDTH * 9 // 16,
+                           tier_idle_seconds=config.TIER_IDLE_SECONDS)
+
+max_frame_wait_ms = 5000  # Upper bound for /frame long-poll requests
+
+def get_camera(camera_id):
+    """Look up a camera pipeline, aborting with 404 for unknown ids"""
+    camera = registry.get(camera_id)
+    if camera is None:
+        abort(404, description=f"Unknown camera: {camera_id}")
+    return camera
+
+def get_tier():
+    """Encoding tier from ?tier=, aborting with 400 for unknown tiers"""
+    tier = request.args.get('tier', DEFAULT_TIER)
+    if tier not in TIERS:
+        abort(400, description=f"Unknown tier: {tier} (choose from {', '.join(TIERS)})")
+    return tier
+
+def warming_up(camera, detection=False):
+    """(message, Retry-After seconds) while the camera or detector is not ready, else None"""
+    if camera.state == 'failed':
+        return f"Camera {camera.camera_id} failed: {camera.open_error}", 30
+    if camera.state in ('stalled', 'reconnecting'):
+        return (f"Camera {camera.camera_id} is {camera.state}",
+                max(1, math.ceil(camera.stream.retry_in())))
+    if not camera.ready:
+        return f"Camera {camera.camera_id} is {camera.state}", 1
+    if detection and batcher.state != 'ready':
+        return f"Detector is {batcher.state}", 1 if batcher.state == 'loading' else 30
+    return None
+
+def unavailable(reason):
+    """503 response telling clients when to retry"""
+    message, retry_after = reason
+    response = Response(message, status=503, mimetype='text/plain')
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def generate_frames(camera, broadcaster):
+    """Generator for video streaming - wakes only when a new frame is published"""
+    for chunk in broadcaster.stream():
+        # The generator resumes once the chunk is written to the client
+        start = time.perf_counter()
+        yield chunk
+        camera.metrics.observe('serve', time.perf_counter() - start)
+        camera.metrics.served.add()
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/cameras')
+@cross_origin()
+def list_cameras():
+    """List configured cameras and their per-camera endpoints"""
+    return jsonify([{
+        'id': camera.camera_id,
+        'source': str(camera.src),
+        'frame_url': f'/cameras/{camera.camera_id}/frame',
+        'video_feed_url': f'/cameras/{camera.camera_id}/video_feed',
+        'detection_url': f'/cameras/{camera.camera_id}/detection'
+    } for camera in registry.cameras.values()])
+
 @app.route('/video_feed')
-def video_feed():
-    """Streaming video feed endpoint"""
-    return Response(generate_frames(),
-                    mimetype='multipart/x-mixed-replace; boundary=frame')
+@app.route('/cameras/<camera_id>/video_feed')
+def video_feed(camera_id=None):
+    """Streaming video feed endpoint (?tier=full|medium|thumb)"""
+    camera = get_camera(camera_id)
+    broadcaster = camera.broadcasters[get_tier()]
+    reason = warming_up(camera)
+    if reason is not None:
+        return unavailable(reason)
+    return Response(generate_frames(camera, broadcaster), mimetype=broadcaster.mimetype)
 
 @app.route('/frame')
+@app.route('/cameras/<camera_id>/frame')
 @cross_origin()
-def get_frame():
-    """Get a single frame as JPEG - optimized for Flutter web"""
-    global current_processed_frame, last_frame_time
+def get_frame(camera_id=None):
+    """
+    Get a single frame as JPEG - optimized for Flutter web
+    
+    Frames carry an ETag, so clients sending If-None-Match get a 304 when
+    nothing new was produced. ?after=<seq>&wait=<ms> long-polls until a
+    frame newer than <seq> is ready (304 if none arrives in time). <seq> is
+    the X-Frame-Seq header: the capture sequence number, the same frame_seq
+    that /detection and events report. A <seq> ahead of the current frame
+    (e.g. kept across a server restart) gets the current frame at once.
+    ?tier=full|medium|thumb selects the encoding resolution.
+    """
+    start = time.perf_counter()
+    camera = get_camera(camera_id)
+    tier = get_tier()
+    broadcaster = camera.broadcasters[tier]
+    reason = warming_up(camera)
+    if reason is not None:
+        return unavailable(reason)
+    broadcaster.touch()  # Keeps this tier encoded while clients poll it
+    after = request.args.get('after', type=int)
+    wait_ms = request.args.get('wait', default=0, type=int)
+    if after is not None and after > broadcaster.latest()[0]:
+        # A seq from before a restart: answer with the current frame
+        # instead of waiting for the counter to catch up
+        after = None
+    if after is not None and wait_ms > 0:
+        broadcaster.wait_for(after, timeout=min(wait_ms, max_frame_wait_ms) / 1000)
+    
+    seq, last_frame_time, frame = broadcaster.latest_bytes()
+    if frame is None or (time.time() - last_frame_time) > 2:
+        # The tier may have been idle; give the pipeline one frame to catch up
+        broadcaster.wait_for(seq, timeout=1.0)
+        seq, last_frame_time, frame = broadcaster.latest_bytes()
     
     # Check if we have a recent frame (within last 2 seconds)
-    if current_processed_frame is None or (time.time() - last_frame_time) > 2:
-        return "Camera not available", 503
+    if frame is None or (time.time() - last_frame_time) > 2:
+        return unavailable(("Camera not available", 1))
+    
+    etag = frame_etag(camera, tier, seq)
+    if (after is not None and seq <= after) or request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(frame, mimetype='image/jpeg')
+        camera.metrics.served.add()
+    response.set_etag(etag)
+    response.headers['X-Frame-Seq'] = str(seq)
+    overlay = broadcaster.overlay_for(seq)
+    if overlay is not None:
+        response.headers['X-Overlay'] = overlay.decode()
+    # Let clients revalidate with If-None-Match instead of refetching
+    response.headers['Cache-Control'] = 'no-cache, must-revalidate'
+    # Long-poll waits are excluded; only the handling cost is recorded
+    if after is None or wait_ms <= 0:
+        camera.metrics.observe('serve', time.perf_counter() - start)
+    return response
+
+def frame_etag(camera, tier, seq):
+    return f'{boot_id}-{camera.camera_id}-{tier}-{seq}'
+
+def detection_payload(camera):
+    """Body of /detection, shared with the async server"""
+    scheduler = camera.scheduler
+    seq, detections = scheduler.latest()
+    return {
+        'detected': bool(detections),
+        'message': "Red Weevil Detected!" if detections else "No Weevils Detected",
+        'detection_count': scheduler.detection_count,
+        'detections': [det.to_dict() for det in detections],
+        'frame_seq': seq,
+        'timestamp': time.time()
+    }
+
+def status_payload():
+    """Body of /status, shared with the async server"""
+    cameras = [camera.status() for camera in registry.cameras.values()]
+    default = cameras[0] if cameras else {}
+    
+    # Top-level fields describe the default camera for single-camera clients
+    return {
+        'ready': batcher.state == 'ready' and all(c['state'] == 'ready' for c in cameras),
+        'detector_state': batcher.state,
+        'camera_active': default.get('camera_active', False),
+        'detection_active': batcher.state == 'ready',
+        'detection_stride': default.get('detection_stride'),
+        'detection_latency_ms': default.get('detection_latency_ms'),
+        # Unique weevils when tracking, otherwise frames with a detection
+        'total_detections': sum(c['total_detections'] for c in cameras),
+        'last_frame_time': default.get('last_frame_time', 0),
+        'stream_clients': default.get('stream_clients', 0),
+        'stream_dropped_frames': default.get('stream_dropped_frames', 0),
+        'metrics': default.get('metrics', {}),
+        'cameras': cameras
+    }
+
+def history_payload(args):
+    """
+    Body of /detections: one page of stored detections
+    
+    args: since/until (epoch seconds or ISO date), camera, limit (1 to 1000)
+    and cursor (next_cursor of the previous page). Raises ValueError on bad
+    arguments and HistoryDisabled when history is disabled.
+    """
+    if store is None:
+        raise HistoryDisabled("Detection history is disabled")
+    limit = int(args.get('limit', 100))
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    detections, next_cursor = store.query(
+        since=parse_time(args.get('since')), until=parse_time(args.get('until')),
+        camera=args.get('camera'), limit=limit, cursor=args.get('cursor'))
+    return {'detections': detections, 'count': len(detections), 'next_cursor': next_cursor}
+
+def daily_payload(args):
+    """Body of /detections/daily: unique weevils and detections per camera per day"""
+    if store is None:
+        raise HistoryDisabled("Detection history is disabled")
+    return {'days': store.daily_counts(
+        since=parse_time(args.get('since')), until=parse_time(args.get('until')),
+        camera=args.get('camera'))}
+
+@app.route('/detections')
+@cross_origin()
+def get_detections():
+    """Paged detection history (?since=&until=&camera=&limit=&cursor=)"""
+    try:
+        return jsonify(history_payload(request.args))
+    except ValueError as e:
+        abort(400, description=str(e))
+    except HistoryDisabled as e:
+        abort(404, description=str(e))
+
+@app.route('/detections/daily')
+@cross_origin()
+def get_daily_detections():
+    """Unique weevils and detections per camera per day (?since=&until=&camera=)"""
+    try:
+        return jsonify(daily_payload(request.args))
+    except ValueError as e:
+        abort(400, description=str(e))
+    except HistoryDisabled as e:
+        abort(404, description=str(e))
+
+@app.route('/thumbnails')
+@cross_origin()
+def get_thumbnails():
+    """
+    One JPEG grid with the latest frame of every camera
     
-    response = Response(current_processed_frame, mimetype='image/jpeg')
-    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
+    The grid is rebuilt at most every THUMBNAIL_MAX_AGE seconds and shared
+    by all requests in between; ?format=json returns the grid layout
+    (camera per cell, online flags, frame times) instead of the image.
+    """
+    generation, jpeg, layout = thumbnails.latest()
+    if request.args.get('format') == 'json':
+        return jsonify(layout)
+    if jpeg is None:
+        return "Thumbnails not available", 503
+    etag = thumbnail_etag(generation)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(jpeg, mimetype='image/jpeg')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'max-age={int(config.THUMBNAIL_MAX_AGE)}'
     return response
 
+def thumbnail_etag(generation):
+    return f'{boot_id}-thumbnails-{generation}'
+
 @app.route('/detection')
+@app.route('/cameras/<camera_id>/detection')
 @cross_origin()
-def get_detection():
+def get_detection(camera_id=None):
     """API endpoint for Flutter app to get detection status"""
-    return jsonify({
-        'detected': detector.last_detection,
-        'message': "Red Weevil Detected!" if detector.last_detection else "No Weevils Detected",
-        'detection_count': detector.detection_count,
-        'timestamp': time.time()
-    })
+    camera = get_camera(camera_id)
+    reason = warming_up(camera, detection=True)
+    if reason is not None:
+        return unavailable(reason)
+    return jsonify(detection_payload(camera))
 
 @app.route('/status')
 @cross_origin()
 def get_status():
     """API endpoint to check if camera is working"""
-    global current_processed_frame, last_frame_time
-    
-    # Check if we have recent frames
-    camera_status = current_processed_frame is not None and (time.time() - last_frame_time) < 5
+    return jsonify(status_payload())
+
+@app.route('/events')
+@cross_origin()
+def get_events():
+    """
+    Server-Sent Events stream of detection events and status heartbeats
     
-    return jsonify({
-        'camera_active': camera_status,
-        'detection_active': True,
-        'total_detections': detector.detection_count,
-        'last_frame_time': last_frame_time
-    })
+    'detection' / 'clear' events carry camera id, frame sequence, boxes and
+    scores; 'heartbeat' events carry the /status body. Reconnecting clients
+    resume from their Last-Event-ID header.
+    """
+    last_id = request.headers.get('Last-Event-ID')
+    response = Response(events.stream(last_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Don't let proxies buffer events
+    return response
+
+@app.route('/metrics')
+def get_metrics():
+    """Pipeline metrics in Prometheus text format"""
+    memory_bytes = int(get_memory_usage() * 1024 * 1024) if PSUTIL_AVAILABLE else None
+    return Response(render_prometheus(registry.cameras.values(), memory_bytes),
+                    mimetype='text/plain; version=0.0.4')
+
+@app.route('/cameras/<camera_id>/status')
+@cross_origin()
+def get_camera_status(camera_id):
+    """Status of a single camera"""
+    return jsonify(get_camera(camera_id).status())
+
+def start():
+    """Start detection, history, clip recording and every camera"""
+    # Worker processes are forked here, before any camera or server thread
+    batcher.start()
+    if store is not None:
+        store.start()
+    if config.CLIP_DIR:
+        for camera_id, pipeline in registry.cameras.items():
+            # Clips reuse the full tier's JPEGs, so that tier stays encoded
+            pipeline.recorder = ClipRecorder(camera_id, pipeline.broadcaster, config.CLIP_DIR,
+                                             pre_seconds=config.CLIP_PRE_SECONDS,
+                                             post_seconds=config.CLIP_POST_SECONDS,
+                                             max_clip_seconds=config.CLIP_MAX_SECONDS,
+                                             max_bytes=int(config.CLIP_MAX_MB * 1024 * 1024)).start()
+            pipeline.scheduler.add_listener(pipeline.recorder.on_detection)
+    # Start capture and frame processing threads for every camera
+    registry.start()
+    events.start_heartbeat(config.EVENT_HEARTBEAT_SECONDS, status_payload)
+    print(f"🎥 Video streams started: {', '.join(registry.cameras)}")
+
+def stop():
+    print("🛑 Stopping video streams...")
+    events.close()
+    batcher.stop()
+    registry.stop()
+    if store is not None:
+        store.stop()
 
 if __name__ == '__main__':
     try:
-        # Start frame processing thread
-        frame_thread = Thread(target=process_frame_continuously, daemon=True)
-        frame_thread.start()
-        
-        print("🎥 Video stream started")
-        print("🔍 Frame processing thread started")
+        start()
         
         # Run Flask server on all interfaces so Flutter app can connect
         app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
     finally:
-        print("🛑 Stopping video stream...")
-        vs.stop()
+        stop()
@@ -0,0 +1,188 @@
+from threading import Lock
+import bisect
+import time
+
+# Latency buckets in seconds (Prometheus convention), +Inf is implicit
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """Cumulative-bucket histogram that renders in Prometheus format"""
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = Lock()
+    
+    def observe(self, value):
+        with self.lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+    
+    def quantile(self, q):
+        """Estimate a quantile by linear interpolation inside its bucket"""
+        with self.lock:
+            if not self.count:
+                return 0.0
+            target = q * self.count
+            cumulative = 0
+            for i, n in enumerate(self.counts):
+                if cumulative + n >= target and n:
+                    lower = self.buckets[i - 1] if i > 0 else 0.0
+                    upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                    return lower + (upper - lower) * (target - cumulative) / n
+                cumulative += n
+            return self.buckets[-1]
+    
+    def samples(self):
+        """(le, cumulative count) pairs plus sum and count"""
+        with self.lock:
+            cumulative, out = 0, []
+            for le, n in zip(self.buckets + (float('inf'),), self.counts):
+                cumulative += n
+                out.append((le, cumulative))
+            return out, self.sum, self.count
+
+class RateCounter:
+    def __init__(self, window=5.0):
+        """Monotonic counter that also reports its rate over a sliding window"""
+        self.window = window
+        self.total = 0
+        self.marks = []  # (timestamp, total) samples, oldest first
+        self.lock = Lock()
+    
+    def add(self, n=1):
+        now = time.monotonic()
+        with self.lock:
+            self.total += n
+            self.marks.append((now, self.total))
+            while len(self.marks) > 2 and now - self.marks[0][0] > self.window:
+                self.marks.pop(0)
+    
+    def rate(self):
+        with self.lock:
+            if len(self.marks) < 2:
+                return 0.0
+            (t0, n0), (t1, n1) = self.marks[0], self.marks[-1]
+            # Stale counters decay to zero instead of reporting the last rate
+            if time.monotonic() - t1 > self.window:
+                return 0.0
+            return (n1 - n0) / (t1 - t0) if t1 > t0 else 0.0
+
+class PipelineMetrics:
+    STAGES = ('capture', 'detect', 'overlay', 'encode', 'serve')
+    
+    def __init__(self):
+        """
+        Per-camera pipeline instrumentation
+        
+        Stages: capture = capture timestamp to processing start, detect =
+        submit to result, overlay/encode = per processed frame, serve = per
+        /frame response or per chunk written to a /video_feed client.
+        """
+        self.stages = {stage: Histogram() for stage in self.STAGES}
+        self.captured = RateCounter()
+        self.processed = RateCounter()
+        self.served = RateCounter()
+        self.dropped_unprocessed = 0  # Captured frames the processing loop never saw
+    
+    def observe(self, stage, seconds):
+        self.stages[stage].observe(seconds)
+    
+    def summary(self):
+        """Compact summary for /status"""
+        return {
+            'capture_fps': round(self.captured.rate(), 1),
+            'processed_fps': round(self.processed.rate(), 1),
+            'served_fps': round(self.served.rate(), 1),
+            'dropped_unprocessed': self.dropped_unprocessed,
+            'stage_ms': {stage: {
+                'p50': round(h.quantile(0.5) * 1000, 2),
+                'p95': round(h.quantile(0.95) * 1000, 2)
+            } for stage, h in self.stages.items()}
+        }
+
+def _labels(**labels):
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels.items()) + '}'
+
+def render_prometheus(pipelines, memory_bytes=None):
+    """Render every camera pipeline's metrics in Prometheus text format"""
+    lines = []
+    
+    def header(name, kind, help_text):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+    
+    header('weevil_stage_seconds', 'histogram', 'Pipeline stage latency in seconds')
+    for p in pipelines:
+        for stage, h in p.metrics.stages.items():
+            buckets, total, count = h.samples()
+            for le, n in buckets:
+                le_text = '+Inf' if le == float('inf') else repr(le)
+                lines.append(f'weevil_stage_seconds_bucket'
+                             f'{_labels(camera=p.camera_id, stage=stage, le=le_text)} {n}')
+            lines.append(f'weevil_stage_seconds_sum{_labels(camera=p.camera_id, stage=stage)} {total}')
+            lines.append(f'weevil_stage_seconds_count{_labels(camera=p.camera_id, stage=stage)} {count}')
+    
+    header('weevil_frames_total', 'counter', 'Frames captured, processed and served')
+    for p in pipelines:
+        for kind in ('captured', 'processed', 'served'):
+            counter = getattr(p.metrics, kind)
+            lines.append(f'weevil_frames_total{_labels(camera=p.camera_id, kind=kind)} {counter.total}')
+    
+    header('weevil_frames_dropped_total', 'counter', 'Frames dropped, by where they were dropped')
+    for p in pipelines:
+        lines.append(f'weevil_frames_dropped_total{_labels(camera=p.camera_id, stage="process")} '
+                     f'{p.metrics.dropped_unprocessed}')
+        for tier, b in p.broadcasters.items():
+            lines.append(f'weevil_frames_dropped_total'
+                         f'{_labels(camera=p.camera_id, stage="stream", tier=tier)} {b.dropped}')
+    
+    header('weevil_queue_depth', 'gauge', 'Items waiting in each stage queue')
+    for p in pipelines:
+        for q in (p.frames, p.encodes):
+            lines.append(f'weevil_queue_depth{_labels(camera=p.camera_id, queue=q.name)} {len(q.items)}')
+    
+    header('weevil_queue_dropped_total', 'counter', 'Items discarded by stage queue drop policies')
+    for p in pipelines:
+        for q in (p.frames, p.encodes):
+            lines.append(f'weevil_queue_dropped_total{_labels(camera=p.camera_id, queue=q.name, policy=q.policy)} {q.dropped}')
+    
+    header('weevil_queue_blocked_seconds_total', 'counter', 'Producer time spent waiting on full stage queues')
+    for p in pipelines:
+        for q in (p.frames, p.encodes):
+            lines.append(f'weevil_queue_blocked_seconds_total{_labels(camera=p.camera_id, queue=q.name)} {q.blocked_seconds}')
+    
+    header('weevil_detection_skipped_total', 'counter', 'Frames not sent to the detector by the scheduler')
+    for p in pipelines:
+        lines.append(f'weevil_detection_skipped_total{_labels(camera=p.camera_id)} {p.scheduler.skipped}')
+    
+    streams = [p for p in pipelines if p.stream is not None]
+    header('weevil_camera_up', 'gauge', '1 while the camera delivers frames, 0 while stalled or reconnecting')
+    for p in streams:
+        lines.append(f'weevil_camera_up{_labels(camera=p.camera_id)} {int(p.stream.health == "ok")}')
+    
+    header('weevil_camera_reconnects_total', 'counter', 'Successful camera reconnects by the capture watchdog')
+    for p in streams:
+        lines.append(f'weevil_camera_reconnects_total{_labels(camera=p.camera_id)} {p.stream.reconnects}')
+    
+    header('weevil_camera_stall_seconds_total', 'counter', 'Seconds spent in capture stalls (gaps without frames)')
+    for p in streams:
+        lines.append(f'weevil_camera_stall_seconds_total{_labels(camera=p.camera_id)} {p.stream.stall_seconds}')
+    
+    header('weevil_stream_clients', 'gauge', 'Connected /video_feed clients')
+    for p in pipelines:
+        for tier, b in p.broadcasters.items():
+            lines.append(f'weevil_stream_clients{_labels(camera=p.camera_id, tier=tier)} {b.subscribers}')
+    
+    header('weevil_jpeg_quality', 'gauge', 'Current JPEG quality per encoding tier')
+    for p in pipelines:
+        for tier, encoder in p.encoders.items():
+            lines.append(f'weevil_jpeg_quality{_labels(camera=p.camera_id, tier=tier)} {encoder.quality}')
+    
+    if memory_bytes is not None:
+        header('weevil_memory_rss_bytes', 'gauge', 'Resident memory of the server process')
+        lines.append(f'weevil_memory_rss_bytes {memory_bytes}')
+    
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,65 @@
+import time
+import cv2
+import numpy as np
+
+class MotionGate:
+    def __init__(self, width=160, pixel_threshold=25, sensitivity=0.002,
+                 learning_rate=0.05, force_seconds=10.0):
+        """
+        Cheap change detector that decides whether a frame is worth inferring on
+        Args:
+            width: Frames are compared at this width in grayscale
+            pixel_threshold: Grey-level difference that counts a pixel as changed
+            sensitivity: Fraction of changed pixels that counts as motion
+            learning_rate: How fast the background model absorbs changes
+            force_seconds: Report motion at least this often so static scenes
+                are still re-checked (0 disables the forced check)
+        
+        The background is a running average of the blurred thumbnails, so a
+        slow-moving weevil keeps registering as a change until it stops and
+        is absorbed, instead of vanishing between two nearly identical frames.
+        """
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.sensitivity = sensitivity
+        self.learning_rate = learning_rate
+        self.force_seconds = force_seconds
+        self.background = None
+        self.last_pass = 0.0
+        self.changed_fraction = 0.0
+        self.passed = 0
+        self.gated = 0
+    
+    def thumbnail(self, frame):
+        height = max(1, round(frame.shape[0] * self.width / frame.shape[1]))
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+    
+    def check(self, frame):
+        """True when the frame differs enough from the background (or a check is due)"""
+        small = self.thumbnail(frame)
+        if self.background is None or self.background.shape != small.shape:
+            self.background = small.astype(np.float32)
+            self.changed_fraction = 1.0
+        else:
+            diff = cv2.absdiff(small, cv2.convertScaleAbs(self.background))
+            self.changed_fraction = float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+            cv2.accumulateWeighted(small, self.background, self.learning_rate)
+        
+        now = time.time()
+        forced = self.force_seconds > 0 and now - self.last_pass >= self.force_seconds
+        if self.changed_fraction >= self.sensitivity or forced:
+            self.last_pass = now
+            self.passed += 1
+            return True
+        self.gated += 1
+        return False
+    
+    def status(self):
+        return {
+            'changed_fraction': round(self.changed_fraction, 4),
+            'frames_passed': self.passed,
+            'frames_gated': self.gated
+        }
@@ -0,0 +1,93 @@
+import json
+import cv2
+import numpy as np
+
+DETECTED_COLOR = (0, 0, 255)
+MONITORING_COLOR = (0, 255, 0)
+
+class Label:
+    """Text rendered once as premultiplied colour plus inverse alpha, and its origin"""
+    __slots__ = ('premultiplied', 'inverse', 'origin')
+    
+    def __init__(self, alpha, color, origin):
+        alpha = alpha[..., np.newaxis].astype(np.float32) / 255
+        self.premultiplied = np.rint(alpha * np.array(color, np.float32)).astype(np.uint8)
+        self.inverse = np.rint(255 * (1 - alpha)).astype(np.uint8).repeat(3, axis=2)
+        self.origin = origin  # (x, y) of the putText origin (baseline start) in the mask
+
+class OverlayCompositor:
+    def __init__(self, font=cv2.FONT_HERSHEY_SIMPLEX, max_labels=64):
+        """
+        Draw detection overlays from pre-rendered labels
+        Args:
+            font: OpenCV Hershey font for every label
+            max_labels: Cached labels before the cache is cleared
+        
+        Text is rasterised once per (text, scale, colour, thickness) into an
+        anti-aliased alpha mask; each frame only blends the label into its
+        own ROI (roi * (1 - alpha) + colour * alpha, as two saturating
+        OpenCV array ops on premultiplied data) instead of re-rasterising
+        the glyphs with cv2.putText. Output is pixel-identical to putText.
+        Small per-detection score labels are cheaper to rasterise than to
+        look up and blend, so they still go through putText.
+        """
+        self.font = font
+        self.max_labels = max_labels
+        self.labels = {}
+    
+    def label(self, text, scale, color, thickness):
+        key = (text, scale, color, thickness)
+        label = self.labels.get(key)
+        if label is None:
+            if len(self.labels) >= self.max_labels:
+                self.labels.clear()
+            (width, height), baseline = cv2.getTextSize(text, self.font, scale, thickness)
+            pad = thickness + 1
+            mask = np.zeros((height + baseline + 2 * pad, width + 2 * pad), np.uint8)
+            cv2.putText(mask, text, (pad, pad + height), self.font, scale, 255, thickness)
+            label = self.labels[key] = Label(mask, color, (pad, pad + height))
+        return label
+    
+    def text(self, frame, text, origin, scale, color, thickness=1):
+        """Blend a cached label with its baseline at origin, like cv2.putText"""
+        label = self.label(text, scale, color, thickness)
+        self.blend(frame, label, origin[0] - label.origin[0], origin[1] - label.origin[1])
+    
+    def blend(self, frame, label, x, y):
+        """Alpha-blend label into frame with its top-left corner at (x, y), clipped"""
+        height, width = label.inverse.shape[:2]
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + width, frame.shape[1]), min(y + height, frame.shape[0])
+        if x0 >= x1 or y0 >= y1:
+            return
+        rows, cols = slice(y0 - y, y1 - y), slice(x0 - x, x1 - x)
+        # Both ops write straight into the ROI view of the frame
+        roi = frame[y0:y1, x0:x1]
+        cv2.multiply(roi, label.inverse[rows, cols], dst=roi, scale=1 / 255)
+        cv2.add(roi, label.premultiplied[rows, cols], dst=roi)
+    
+    def draw(self, frame, detections):
+        """Status banner plus a box and score per detection"""
+        if detections:
+            self.text(frame, "WEEVIL DETECTED!", (10, 30), 1, DETECTED_COLOR, 2)
+            for det in detections:
+                x1, y1, x2, y2 = (int(v) for v in det.box)
+                cv2.rectangle(frame, (x1, y1), (x2, y2), DETECTED_COLOR, 2)
+                cv2.putText(frame, f"{det.score:.2f}", (x1, max(y1 - 5, 10)),
+                            self.font, 0.5, DETECTED_COLOR, 1)
+        else:
+            self.text(frame, "Monitoring...", (10, 30), 1, MONITORING_COLOR, 2)
+
+def overlay_metadata(detections, size=None):
+    """
+    Compact JSON describing what to draw over one frame, for client-side overlays
+    Args:
+        detections: Detections shown on the frame
+        size: (width, height) of the frame the boxes refer to, so clients can
+            scale them onto any tier
+    """
+    payload = {'boxes': [[*(int(v) for v in det.box), round(float(det.score), 2), det.track_id]
+                         for det in detections]}
+    if size is not None:
+        payload['size'] = [int(size[0]), int(size[1])]
+    return json.dumps(payload, separators=(',', ':')).encode()
@@ -0,0 +1,98 @@
+from collections import deque
+from threading import Condition
+import time
+
+DROP_OLDEST = 'drop-oldest'  # Make room by discarding the oldest queued item
+DROP_NEWEST = 'drop-newest'  # Refuse the incoming item
+BLOCK = 'block'              # Make the producer wait for room
+POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+class StageQueue:
+    def __init__(self, name, maxsize=2, policy=DROP_OLDEST, on_drop=None):
+        """
+        Bounded hand-off between two pipeline stages
+        Args:
+            name: Stage name used in /status and /metrics
+            maxsize: Items held before the policy applies
+            policy: DROP_OLDEST, DROP_NEWEST or BLOCK
+            on_drop: Called with every discarded item (outside the lock), e.g.
+                to return a pooled buffer
+
+        Every overflow is counted, so a stage that falls behind shows up as
+        drops or producer wait time on its input queue instead of as a
+        silent stall.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown queue policy: {policy} (choose from {', '.join(POLICIES)})")
+        self.name = name
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self.on_drop = on_drop
+        self.items = deque()
+        self.changed = Condition()
+        self.closed = False
+        self.put_count = 0
+        self.dropped = 0
+        self.blocked_seconds = 0.0  # Producer time spent waiting (BLOCK policy)
+        self.high_water = 0
+
+    def put(self, item):
+        """Queue an item, applying the policy when full; False if item was refused"""
+        dropped = None
+        with self.changed:
+            if self.closed:
+                dropped = item
+            elif len(self.items) >= self.maxsize:
+                if self.policy == DROP_NEWEST:
+                    dropped = item
+                elif self.policy == DROP_OLDEST:
+                    dropped = self.items.popleft()
+                else:
+                    start = time.monotonic()
+                    self.changed.wait_for(lambda: self.closed or len(self.items) < self.maxsize)
+                    self.blocked_seconds += time.monotonic() - start
+                    if self.closed:
+                        dropped = item
+            if dropped is not item:
+                self.items.append(item)
+                self.put_count += 1
+                self.high_water = max(self.high_water, len(self.items))
+                self.changed.notify_all()
+            if dropped is not None and not self.closed:
+                self.dropped += 1
+        if dropped is not None and self.on_drop is not None:
+            self.on_drop(dropped)
+        return dropped is not item
+
+    def get(self, timeout=None):
+        """Oldest queued item, or None on timeout or close"""
+        with self.changed:
+            self.changed.wait_for(lambda: self.closed or self.items, timeout)
+            if not self.items:
+                return None
+            item = self.items.popleft()
+            self.changed.notify_all()  # Wake a blocked producer
+            return item
+
+    def close(self):
+        """Wake every waiter and discard what is still queued"""
+        with self.changed:
+            self.closed = True
+            pending = list(self.items)
+            self.items.clear()
+            self.changed.notify_all()
+        if self.on_drop is not None:
+            for item in pending:
+                self.on_drop(item)
+
+    def status(self):
+        with self.changed:
+            return {
+                'policy': self.policy,
+                'depth': len(self.items),
+                'maxsize': self.maxsize,
+                'high_water': self.high_water,
+                'queued': self.put_count,
+                'dropped': self.dropped,
+                'blocked_ms': round(self.blocked_seconds * 1000, 1)
+            }
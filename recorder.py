@@ -0,0 +1,170 @@
+from collections import deque
+from threading import Thread, Lock
+import json
+import os
+import queue
+import time
+
+class ClipRecorder:
+    def __init__(self, camera_id, broadcaster, directory, pre_seconds=5.0, post_seconds=5.0,
+                 max_clip_seconds=60.0, max_bytes=1024 * 1024 * 1024):
+        """
+        Detection-triggered clip recording from already-encoded frames
+        Args:
+            camera_id: Camera the clips belong to (used in file names)
+            broadcaster: FrameBroadcaster whose JPEGs are recorded
+            directory: Where clips are written
+            pre_seconds: Seconds of frames kept from before a detection
+            post_seconds: Seconds recorded after the last detection
+            max_clip_seconds: Longest clip before it is cut and a new one starts
+            max_bytes: Oldest clips are deleted once the directory grows past this
+        
+        The recorder keeps references to the broadcaster's JPEG bytes in a
+        ring buffer, so recording never decodes or re-encodes a frame. A
+        writer thread does all file I/O. Clips are raw MJPEG streams; each
+        has a .json sidecar with frame timestamps and the triggering
+        detections. `ffmpeg -framerate <fps> -i clip.mjpeg -c copy clip.avi`
+        remuxes one without re-encoding.
+        """
+        self.camera_id = camera_id
+        self.broadcaster = broadcaster
+        self.directory = directory
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.max_clip_seconds = max_clip_seconds
+        self.max_bytes = max_bytes
+        self.ring = deque()  # (timestamp, jpeg) of recent frames
+        self.lock = Lock()
+        self.clip = None  # Metadata of the clip being recorded
+        self.record_until = 0.0
+        self.writes = queue.Queue()
+        self.clips_written = 0
+        self.clips_evicted = 0
+        os.makedirs(directory, exist_ok=True)
+    
+    def start(self):
+        # Keep this tier encoded even when no viewer is connected
+        self.broadcaster.pin()
+        self.broadcaster.add_listener(self.on_frame)
+        self.thread = Thread(target=self.run, args=())
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+    
+    def on_frame(self):
+        """Broadcaster listener: buffer the new frame, or append it to the open clip"""
+        seq, timestamp, jpeg = self.broadcaster.latest()
+        with self.lock:
+            if self.clip is not None:
+                if timestamp > self.record_until or timestamp - self.clip['start'] > self.max_clip_seconds:
+                    self.close_clip()
+                else:
+                    self.clip['frames'].append(timestamp)
+                    self.writes.put(('frame', self.clip['name'], jpeg))
+                    return
+            self.ring.append((timestamp, jpeg))
+            while self.ring and timestamp - self.ring[0][0] > self.pre_seconds:
+                self.ring.popleft()
+    
+    def on_detection(self, seq, detections, latency):
+        """DetectionScheduler listener: open a clip or extend the open one"""
+        if not detections:
+            return
+        now = time.time()
+        with self.lock:
+            self.record_until = now + self.post_seconds
+            if self.clip is None:
+                self.open_clip(now)
+            self.clip['detections'].append({
+                'timestamp': now,
+                'frame_seq': seq,
+                'detections': [det.to_dict() for det in detections]
+            })
+    
+    def open_clip(self, now):
+        name = f"{self.camera_id}_{time.strftime('%Y%m%d_%H%M%S', time.localtime(now))}_{int(now * 1000) % 1000:03d}"
+        pre_roll = list(self.ring)
+        self.ring.clear()
+        self.clip = {
+            'name': name,
+            'camera': self.camera_id,
+            'start': pre_roll[0][0] if pre_roll else now,
+            'trigger': now,
+            'frames': [t for t, _ in pre_roll],
+            'detections': []
+        }
+        self.writes.put(('open', name, [jpeg for _, jpeg in pre_roll]))
+    
+    def close_clip(self):
+        clip, self.clip = self.clip, None
+        frames = clip['frames']
+        clip['end'] = frames[-1] if frames else clip['trigger']
+        duration = clip['end'] - clip['start']
+        clip['fps'] = round((len(frames) - 1) / duration, 2) if duration > 0 else 0
+        self.writes.put(('close', clip['name'], clip))
+    
+    def run(self):
+        """Writer thread: all clip file I/O happens here"""
+        files = {}
+        while True:
+            action, name, payload = self.writes.get()
+            if action == 'stop':
+                break
+            path = os.path.join(self.directory, name)
+            try:
+                if action == 'open':
+                    files[name] = open(path + '.mjpeg', 'wb')
+                    for jpeg in payload:
+                        files[name].write(jpeg)
+                elif action == 'frame':
+                    files[name].write(payload)
+                elif action == 'close':
+                    files.pop(name).close()
+                    with open(path + '.json', 'w') as f:
+                        json.dump(payload, f)
+                    self.clips_written += 1
+                    print(f"🎞️  Saved clip {name} ({len(payload['frames'])} frames)")
+                    self.evict()
+            except (OSError, KeyError) as e:
+                print(f"Clip writer error ({name}): {e}")
+    
+    def evict(self):
+        """Delete the oldest clips until the directory fits max_bytes"""
+        clips = {}
+        for entry in os.scandir(self.directory):
+            stem, ext = os.path.splitext(entry.name)
+            if ext in ('.mjpeg', '.json'):
+                size, mtime = clips.get(stem, (0, entry.stat().st_mtime))
+                clips[stem] = (size + entry.stat().st_size, min(mtime, entry.stat().st_mtime))
+        total = sum(size for size, _ in clips.values())
+        for stem, (size, _) in sorted(clips.items(), key=lambda item: item[1][1]):
+            if total <= self.max_bytes:
+                break
+            if self.clip is not None and stem == self.clip['name']:
+                continue
+            for ext in ('.mjpeg', '.json'):
+                try:
+                    os.remove(os.path.join(self.directory, stem + ext))
+                except FileNotFoundError:
+                    pass
+            total -= size
+            self.clips_evicted += 1
+    
+    def stop(self):
+        """Finish the clip being recorded and stop the writer"""
+        with self.lock:
+            if self.clip is not None:
+                self.close_clip()
+        self.writes.put(('stop', None, None))
+        thread = getattr(self, 'thread', None)
+        if thread is not None:
+            thread.join(timeout=5.0)
+    
+    def status(self):
+        with self.lock:
+            return {
+                'recording': self.clip is not None,
+                'buffered_frames': len(self.ring),
+                'clips_written': self.clips_written,
+                'clips_evicted': self.clips_evicted
+            }
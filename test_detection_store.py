@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Regression checks for the detection history (run directly or with pytest)
+"""
+import os
+import tempfile
+import time
+from detectors import Detection
+from detection_store import DetectionStore
+from tracker import Tracker
+
+def make_store(directory, min_track_hits=2):
+    return DetectionStore(os.path.join(directory, 'detections.db'), flush_interval=0.05,
+                          min_track_hits=min_track_hits).start()
+
+def test_daily_counts_skip_unconfirmed_tracks():
+    """One-off detections get a track id but must not count as weevils"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = make_store(directory)
+        tracker = Tracker(min_hits=2)
+        now = time.time()
+        # Ten sightings far apart in space and time: ten tracks of one hit each
+        for i in range(10):
+            box = (i * 100, 0, i * 100 + 20, 20)
+            tracked = tracker.update([Detection(box, 0.9, 0)], i * 10.0)
+            store.record('trap1', i, now, tracked)
+        # One weevil seen on three consecutive inferences
+        for i in range(3):
+            tracked = tracker.update([Detection((500, 500, 540, 520), 0.9, 0)], 200.0 + i)
+            store.record('trap1', 100 + i, now, tracked)
+        store.stop()
+        
+        days = store.daily_counts()
+        assert tracker.unique_count == 1
+        assert [(d['camera'], d['count'], d['detections']) for d in days] == [('trap1', 1, 13)]
+
+def test_daily_counts_count_untracked_rows():
+    """With tracking off every stored box is counted, as before track ids existed"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = make_store(directory)
+        for i in range(4):
+            store.record('trap2', i, time.time(), [Detection((0, 0, 10, 10), 0.8, 0)])
+        store.stop()
+        
+        days = store.daily_counts()
+        assert [(d['camera'], d['count'], d['detections']) for d in days] == [('trap2', 4, 4)]
+
+if __name__ == "__main__":
+    for test in (test_daily_counts_skip_unconfirmed_tracks, test_daily_counts_count_untracked_rows):
+        test()
+        print(f"✅ {test.__name__}")
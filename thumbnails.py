@@ -0,0 +1,89 @@
+from threading import Lock
+import math
+import time
+import cv2
+import numpy as np
+
+class ThumbnailGrid:
+    def __init__(self, registry, tier='thumb', cell_width=320, cell_height=180,
+                 max_age=3.0, quality=70, tier_idle_seconds=5.0):
+        """
+        One cached JPEG showing the latest frame of every camera
+        Args:
+            registry: CameraRegistry whose cameras are shown, in config order
+            tier: Encoding tier the cells are taken from
+            cell_width, cell_height: Size of each camera's cell
+            max_age: Seconds a rendered grid is served before it is rebuilt
+            quality: JPEG quality of the grid
+            tier_idle_seconds: Frames older than this count as offline
+        
+        Cells reuse each camera's already-encoded thumbnail tier (decoding a
+        320 px JPEG is cheap), so no full-resolution frame is touched. Every
+        request within max_age gets the same bytes; concurrent requests for
+        a stale grid wait for a single rebuild.
+        """
+        self.registry = registry
+        self.tier = tier
+        self.cell_size = (cell_width, cell_height)
+        self.max_age = max_age
+        self.quality = quality
+        self.tier_idle_seconds = tier_idle_seconds
+        self.lock = Lock()
+        self.jpeg = None
+        self.generation = 0
+        self.generated_at = 0.0
+        self.layout = {}
+    
+    def latest(self):
+        """(generation, jpeg bytes, layout) of a grid at most max_age old"""
+        cameras = list(self.registry.cameras.values())
+        for camera in cameras:
+            camera.broadcasters[self.tier].touch()  # Keep the source tier encoded
+        with self.lock:
+            if self.jpeg is None or time.time() - self.generated_at >= self.max_age:
+                self.render(cameras)
+            return self.generation, self.jpeg, self.layout
+    
+    def render(self, cameras):
+        cell_width, cell_height = self.cell_size
+        columns = max(1, math.ceil(math.sqrt(len(cameras))))
+        rows = max(1, math.ceil(len(cameras) / columns))
+        grid = np.zeros((rows * cell_height, columns * cell_width, 3), np.uint8)
+        now = time.time()
+        cells = []
+        for index, camera in enumerate(cameras):
+            broadcaster = camera.broadcasters[self.tier]
+            seq, timestamp, jpeg = broadcaster.latest()
+            if (jpeg is None or now - timestamp > 2) and now - camera.last_frame_time < 2:
+                # The tier was idle until now; give the live camera one frame to catch up
+                broadcaster.wait_for(seq, timeout=1.0)
+                seq, timestamp, jpeg = broadcaster.latest()
+            online = jpeg is not None and now - timestamp < self.tier_idle_seconds
+            y, x = divmod(index, columns)
+            cell = grid[y * cell_height:(y + 1) * cell_height, x * cell_width:(x + 1) * cell_width]
+            if online:
+                self.fit(cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR), cell)
+            else:
+                cell[:] = (40, 40, 40)
+                cv2.putText(cell, "OFFLINE", (10, cell_height // 2), cv2.FONT_HERSHEY_SIMPLEX,
+                            0.8, (0, 0, 255), 2)
+            cv2.putText(cell, camera.camera_id, (8, cell_height - 10), cv2.FONT_HERSHEY_SIMPLEX,
+                        0.5, (255, 255, 255), 1)
+            cells.append({'camera_id': camera.camera_id, 'row': y, 'column': x,
+                          'online': online, 'frame_time': timestamp})
+        
+        ret, buffer = cv2.imencode('.jpg', grid, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if ret:
+            self.jpeg = buffer.tobytes()
+            self.generation += 1
+        self.generated_at = time.time()
+        self.layout = {'columns': columns, 'rows': rows, 'cell_width': cell_width,
+                       'cell_height': cell_height, 'generated_at': now, 'cells': cells}
+    
+    def fit(self, frame, cell):
+        """Letterbox frame into cell, keeping its aspect ratio"""
+        cell_height, cell_width = cell.shape[:2]
+        scale = min(cell_width / frame.shape[1], cell_height / frame.shape[0])
+        width, height = max(1, int(frame.shape[1] * scale)), max(1, int(frame.shape[0] * scale))
+        x, y = (cell_width - width) // 2, (cell_height - height) // 2
+        cell[y:y + height, x:x + width] = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
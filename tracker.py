@@ -0,0 +1,142 @@
+from itertools import count
+import numpy as np
+from detectors import Detection
+
+def iou_matrix(a, b):
+    """(N, M) intersection-over-union of two (N, 4) / (M, 4) corner box arrays"""
+    a = np.asarray(a, np.float32).reshape(-1, 1, 4)
+    b = np.asarray(b, np.float32).reshape(1, -1, 4)
+    w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = w * h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-6)
+
+class Track:
+    """One tracked object: last matched box plus a constant-velocity estimate"""
+    __slots__ = ('track_id', 'box', 'velocity', 'class_id', 'score', 'hits', 'last_seen', 'matched')
+    
+    def __init__(self, track_id, detection, timestamp):
+        self.track_id = track_id
+        self.box = np.array(detection.box, np.float32)
+        self.velocity = np.zeros(4, np.float32)  # Box corners, pixels per second
+        self.class_id = detection.class_id
+        self.score = detection.score
+        self.hits = 1
+        self.last_seen = timestamp
+        self.matched = True  # Matched by the most recent update
+    
+    def predict(self, timestamp, horizon=1.0):
+        """Box extrapolated to timestamp (at most horizon seconds ahead)"""
+        return self.box + self.velocity * min(max(timestamp - self.last_seen, 0.0), horizon)
+    
+    def update(self, detection, timestamp):
+        box = np.array(detection.box, np.float32)
+        dt = timestamp - self.last_seen
+        if dt > 0:
+            self.velocity = 0.5 * self.velocity + 0.5 * (box - self.box) / dt
+        self.box = box
+        self.score = detection.score
+        self.hits += 1
+        self.last_seen = timestamp
+        self.matched = True
+
+class Tracker:
+    def __init__(self, iou_threshold=0.3, max_distance=2.0, max_age=2.0, min_hits=2):
+        """
+        Associate detections across inference frames into stable tracks
+        Args:
+            iou_threshold: Smallest IoU between a track's predicted box and a
+                detection that counts as the same object
+            max_distance: Fallback match when boxes do not overlap enough:
+                centre distance, in track box diagonals (small, fast insects)
+            max_age: Seconds a track survives without a matching detection
+            min_hits: Detections needed before a track counts as a weevil
+        
+        Association is greedy on a vectorised IoU matrix (best pairs first),
+        so the cost is a few NumPy operations per inference result. A track
+        is counted once, when it is confirmed, so a weevil sitting in view
+        for minutes is one weevil rather than one per frame.
+        """
+        self.iou_threshold = iou_threshold
+        self.max_distance = max_distance
+        self.max_age = max_age
+        self.min_hits = max(1, min_hits)
+        self.tracks = []
+        self.ids = count(1)
+        self.unique_count = 0  # Tracks that reached min_hits
+        self.updates = 0
+    
+    def update(self, detections, timestamp):
+        """
+        Match one inference result to the tracks
+        Args:
+            detections: Detections found in the frame
+            timestamp: time.monotonic() of the frame the detections belong to
+        Returns the detections with their track_id filled in
+        """
+        self.updates += 1
+        boxes = np.array([d.box for d in detections], np.float32).reshape(-1, 4)
+        predicted = np.array([t.predict(timestamp) for t in self.tracks], np.float32).reshape(-1, 4)
+        
+        affinity = iou_matrix(predicted, boxes)
+        if self.tracks and detections:
+            # Centre distance ranks below any IoU match and only fills the gaps
+            centres_t = (predicted[:, :2] + predicted[:, 2:]) / 2
+            centres_d = (boxes[:, :2] + boxes[:, 2:]) / 2
+            diagonals = np.maximum(np.hypot(*(predicted[:, 2:] - predicted[:, :2]).T), 1.0)
+            distance = np.linalg.norm(centres_t[:, None] - centres_d[None], axis=2) / diagonals[:, None]
+            nearby = np.clip(1 - distance / self.max_distance, 0, None) * 1e-3
+            affinity = np.where(affinity >= self.iou_threshold, affinity, nearby)
+            classes_t = np.array([t.class_id for t in self.tracks])
+            classes_d = np.array([d.class_id for d in detections])
+            affinity[classes_t[:, None] != classes_d[None]] = 0
+        
+        for track in self.tracks:
+            track.matched = False
+        assigned = [None] * len(detections)
+        used = set()
+        for flat in np.argsort(-affinity, axis=None):
+            t, d = divmod(int(flat), len(detections))
+            if affinity[t, d] <= 0:
+                break
+            if t in used or assigned[d] is not None:
+                continue
+            used.add(t)
+            assigned[d] = self.tracks[t]
+        
+        tracked = []
+        for detection, track in zip(detections, assigned):
+            if track is None:
+                track = Track(next(self.ids), detection, timestamp)
+                self.tracks.append(track)
+            else:
+                track.update(detection, timestamp)
+            if track.hits == self.min_hits:
+                self.unique_count += 1
+            tracked.append(detection._replace(track_id=track.track_id))
+        self.tracks = [t for t in self.tracks if timestamp - t.last_seen <= self.max_age]
+        return tracked
+    
+    def predict(self, timestamp):
+        """Detections for the live tracks, extrapolated to timestamp"""
+        detections = []
+        for track in self.tracks:
+            if track.hits < self.min_hits and not track.matched:
+                continue  # A single unconfirmed sighting that was not seen again
+            x1, y1, x2, y2 = (int(v) for v in track.predict(timestamp))
+            detections.append(Detection((max(0, x1), max(0, y1), x2, y2),
+                                        track.score, track.class_id, track.track_id))
+        return detections
+    
+    def steady(self):
+        """True while every track is confirmed and was matched last update"""
+        return bool(self.tracks) and all(t.matched and t.hits >= self.min_hits for t in self.tracks)
+    
+    def status(self):
+        return {
+            'active_tracks': len(self.tracks),
+            'unique_count': self.unique_count,
+            'updates': self.updates
+        }
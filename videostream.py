@@ -1,59 +1,546 @@
+import os
 import cv2
-from threading import Thread
+from threading import Thread, Condition, Lock
 import time
+import numpy as np
+
+def is_jpeg(frame):
+    """True for an undecoded JPEG buffer as returned in passthrough mode"""
+    data = frame.reshape(-1) if frame is not None else None
+    return data is not None and frame.dtype == np.uint8 and (frame.ndim == 1 or frame.shape[0] == 1) \
+        and data.size > 2 and data[0] == 0xFF and data[1] == 0xD8
+
+class FramePool:
+    def __init__(self, size=4):
+        """
+        Recycled frame buffers for the capture thread
+        Args:
+            size: Idle buffers kept for reuse; extra ones are left to the GC
+        """
+        self.size = size
+        self.free = []
+        self.lock = Lock()
+        self.allocated = 0  # Buffers the capture thread had to allocate
+        self.reused = 0
+    
+    def take(self, shape=None):
+        """An idle buffer of the given shape, or None if the caller must allocate"""
+        with self.lock:
+            while self.free:
+                buffer = self.free.pop()
+                if shape is None or buffer.shape == shape:
+                    self.reused += 1
+                    return buffer
+            self.allocated += 1
+            return None
+    
+    def give(self, buffer):
+        """Return a buffer nobody references any more"""
+        with self.lock:
+            if len(self.free) < self.size:
+                self.free.append(buffer)
+
+# Capture APIs selectable by name; 'auto' lets OpenCV choose
+CAPTURE_BACKENDS = {
+    'auto': cv2.CAP_ANY,
+    'v4l2': cv2.CAP_V4L2,
+    'ffmpeg': cv2.CAP_FFMPEG,
+    'gstreamer': cv2.CAP_GSTREAMER,
+    'dshow': cv2.CAP_DSHOW,
+    'msmf': cv2.CAP_MSMF,
+    'avfoundation': cv2.CAP_AVFOUNDATION,
+}
 
 class VideoStream:
-    def __init__(self, src=0, fps=30):
+    def __init__(self, src=0, fps=30, loop=False, realtime=False, buffers=4,
+                 backend='auto', fourcc=None, width=1280, height=720, passthrough=False,
+                 reconnect=True, stall_timeout=5.0, max_backoff=30.0):
         """
         Initialize video stream
         Args:
-            src: Camera source (0 for default camera)
+            src: Camera source (0 for default camera), video file or stream URL
             fps: Target FPS for camera capture
+            loop: Rewind video files when they reach the end
+            realtime: Pace file playback at fps instead of decoding flat out
+            buffers: Frame buffers recycled between captures (see FramePool)
+            backend: Capture API name from CAPTURE_BACKENDS
+            fourcc: Pixel format to request from the device, e.g. 'MJPG'
+            width, height: Largest resolution to request
+            passthrough: With an MJPG source, deliver the camera's JPEG bytes
+                undecoded (format 'jpeg') when the backend supports it
+            reconnect: Reopen the device when reads fail or frames stop
+            stall_timeout: Seconds without a frame that count as a stall
+            max_backoff: Longest wait between reconnect attempts
         """
-        self.stream = cv2.VideoCapture(src)
+        if backend not in CAPTURE_BACKENDS:
+            raise ValueError(f"Unknown capture backend: {backend} (choose from {', '.join(CAPTURE_BACKENDS)})")
+        self.src = src
+        self.api = CAPTURE_BACKENDS[backend]
+        self.fourcc = fourcc
+        self.passthrough = passthrough
+        self.fps = fps
+        self.loop = loop
+        self.realtime = realtime
+        self.max_size = (width, height)
+        self.requested_size = None  # Applied by the capture thread between reads
+        self.init_watchdog(reconnect, stall_timeout, max_backoff)
+        self.open_device()
         
-        # Set camera properties for better performance
-        self.stream.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-        self.stream.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-        self.stream.set(cv2.CAP_PROP_FPS, fps)
-        self.stream.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Reduce buffer to minimize latency
+        # "Latest frame" slot: every captured frame gets a monotonically
+        # increasing sequence number and capture timestamp, and consumers
+        # wait on the condition instead of polling read()
+        self.frame_ready = Condition()
+        self.seq = 0
+        self.timestamp = 0.0
+        self.next_due = 0.0
+        self.frame_interval = 0.0  # EMA of seconds between captured frames
+        self.init_pool(buffers)
         
-        # Read first frame
-        (self.grabbed, self.frame) = self.stream.read()
+        (self.grabbed, self.frame) = self.warm_up()
+        if self.grabbed:
+            self.seq = 1
+            self.timestamp = time.time()
         self.stopped = False
         
-        # Camera warm-up time
-        time.sleep(1.0)
+        negotiated = self.negotiated()
+        print(f"📹 Camera initialized: {negotiated['width']}x{negotiated['height']} "
+              f"{negotiated['fourcc'] or '?'} @ {negotiated['fps']} FPS via {negotiated['backend']}"
+              + (" (JPEG passthrough)" if self.format == 'jpeg' else ""))
+    
+    def open_device(self):
+        """(Re)open the capture device with the configured settings"""
+        if isinstance(self.src, str) and '://' in self.src and hasattr(cv2, 'CAP_PROP_READ_TIMEOUT_MSEC'):
+            # FFmpeg otherwise blocks ~30 s in open()/read() on a dead RTSP or
+            # HTTP stream, long past the watchdog's stall_timeout
+            timeout_ms = int(self.stall_timeout * 1000)
+            self.stream = cv2.VideoCapture(self.src, self.api, [
+                cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout_ms,
+                cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout_ms])
+        else:
+            self.stream = cv2.VideoCapture(self.src, self.api)
+        width, height = self.max_size
+        self.target_size = self.max_size  # Last size asked of the device
+        
+        # Set camera properties for better performance; the pixel format
+        # must be chosen before the size for V4L2 to offer MJPEG modes
+        if self.fourcc:
+            self.stream.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*self.fourcc))
+        self.stream.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.stream.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        self.stream.set(cv2.CAP_PROP_FPS, self.fps)
+        self.stream.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Reduce buffer to minimize latency
+        self.format = 'bgr'
+        if self.passthrough and (self.fourcc or '').upper() == 'MJPG':
+            # Only V4L2 hands out the raw MJPEG buffer; other backends would
+            # return undecoded planes instead
+            if self.backend_name() == 'V4L2':
+                self.stream.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+                self.format = 'jpeg'
+            else:
+                print(f"⚠️  JPEG passthrough needs the V4L2 backend (got {self.backend_name()}) - decoding frames")
+    
+    def warm_up(self, timeout=1.0):
+        """Read until the device delivers its first frame (at most timeout seconds)"""
+        deadline = time.monotonic() + timeout
+        (grabbed, frame) = self.stream.read()
+        while not grabbed and self.stream.isOpened() and time.monotonic() < deadline:
+            time.sleep(0.05)
+            (grabbed, frame) = self.stream.read()
+        if self.format == 'jpeg' and grabbed and not is_jpeg(frame):
+            # The backend decoded anyway; fall back to normal BGR frames
+            self.stream.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+            self.format = 'bgr'
+            (grabbed, frame) = self.stream.read()
+        return grabbed, frame
+    
+    def negotiated(self):
+        """What the device actually agreed to: backend, pixel format, size and FPS"""
+        code = max(0, int(self.stream.get(cv2.CAP_PROP_FOURCC)))
+        fourcc = ''.join(chr((code >> (8 * i)) & 0xFF) for i in range(4)).strip('\x00 ')
+        return {
+            'backend': self.backend_name(),
+            'fourcc': fourcc,
+            'width': int(self.stream.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(self.stream.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            'fps': round(self.stream.get(cv2.CAP_PROP_FPS), 2)
+        }
+    
+    def is_opened(self):
+        return self.stream is not None and self.stream.isOpened()
+    
+    def backend_name(self):
+        try:
+            return self.stream.getBackendName()
+        except cv2.error:
+            return 'unknown'  # Capture failed to open
+    
+    def request_width(self, width):
+        """
+        Ask for the cheapest resolution at least `width` pixels wide
+        
+        Candidates halve the configured maximum (keeping its aspect ratio)
+        down to 320 px; the capture thread switches between frames. Only a
+        change of target is sent to the device, so one that rounds to a
+        nearby mode is not re-asked (and its stream restarted) every call.
+        """
+        size = self.max_size
+        while size[0] // 2 >= max(width, 320):
+            size = (size[0] // 2, size[1] // 2)
+        if size == self.target_size:
+            return
+        self.target_size = size
+        if size != self.current_size():
+            self.requested_size = size
+    
+    def current_size(self):
+        return (int(self.stream.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                int(self.stream.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    
+    def apply_requested_size(self):
+        size, self.requested_size = self.requested_size, None
+        self.stream.set(cv2.CAP_PROP_FRAME_WIDTH, size[0])
+        self.stream.set(cv2.CAP_PROP_FRAME_HEIGHT, size[1])
+        print(f"📐 Capture resolution {size[0]}x{size[1]} requested, got {'x'.join(map(str, self.current_size()))}")
+    
+    def status(self):
+        """Negotiated capture settings, the measured frame rate and watchdog counters"""
+        return {
+            **self.negotiated(),
+            'format': self.format,
+            'measured_fps': round(1.0 / self.frame_interval, 1) if self.frame_interval else 0.0,
+            'health': self.health,
+            'reconnects': self.reconnects,
+            'reconnect_attempts': self.reconnect_attempts,
+            'read_failures': self.read_failures,
+            'stalls': self.stalls,
+            'stall_seconds': round(self.stall_seconds, 1),
+            'last_stall_seconds': round(self.last_stall_seconds, 1),
+            'seconds_since_frame': round(time.monotonic() - self.last_frame_monotonic, 1),
+            'last_error': self.last_error
+        }
+    
+    def init_watchdog(self, reconnect, stall_timeout, max_backoff):
+        # A device that stops delivering (unplugged, hub reset, dead stream)
+        # is reopened with exponential backoff; gaps between frames longer
+        # than stall_timeout are counted as stalls
+        self.reconnect = reconnect
+        self.stall_timeout = stall_timeout
+        self.max_backoff = max_backoff
+        self.reconnecting = False
+        self.next_retry = 0.0  # time.monotonic() of the next reconnect attempt
+        self.reconnects = 0
+        self.reconnect_attempts = 0
+        self.read_failures = 0
+        self.stalls = 0
+        self.stall_seconds = 0.0
+        self.last_stall_seconds = 0.0
+        self.last_frame_monotonic = time.monotonic()
+        self.last_error = None
+    
+    @property
+    def health(self):
+        """ok, stalled (no frame for stall_timeout) or reconnecting"""
+        if self.reconnecting:
+            return 'reconnecting'
+        if time.monotonic() - self.last_frame_monotonic > self.stall_timeout:
+            return 'stalled'
+        return 'ok'
+    
+    def retry_in(self):
+        """Seconds until the next reconnect attempt (0 when not waiting)"""
+        return max(0.0, self.next_retry - time.monotonic()) if self.reconnecting else 0.0
+    
+    def init_pool(self, buffers):
+        # Frames are read into recycled buffers. A frame handed out with
+        # borrow=True stays untouched until release(); one handed out any
+        # other way is never recycled, so plain readers are always safe
+        self.pool = FramePool(buffers)
+        self.borrowed = {}  # id(frame) -> [frame, borrow count, recyclable]
+        self.shared = False  # Current frame was handed out without borrowing
+        self.consumers = []  # StageQueues fed with every (seq, timestamp, frame)
+    
+    def add_consumer(self, queue):
+        """
+        Push every captured frame into a StageQueue
         
-        print(f"📹 Camera initialized: {self.stream.get(cv2.CAP_PROP_FRAME_WIDTH)}x{self.stream.get(cv2.CAP_PROP_FRAME_HEIGHT)} @ {self.stream.get(cv2.CAP_PROP_FPS)} FPS")
+        Queued frames are borrowed: whoever takes one off the queue, and the
+        queue's on_drop for frames it discards, must release() it.
+        """
+        self.consumers.append(queue)
     
     def start(self):
         """Start the video stream thread"""
-        t = Thread(target=self.update, args=())
-        t.daemon = True
-        t.start()
+        self.thread = Thread(target=self.update, args=())
+        self.thread.daemon = True
+        self.thread.start()
         print("🎬 Video stream thread started")
         return self
     
     def update(self):
-        """Continuously read frames from camera"""
-        while True:
-            if self.stopped:
-                return
+        """Continuously read frames from camera, reopening it when it goes away"""
+        failures = 0
+        while not self.stopped:
+            # Read frame from camera (blocks until the device delivers one)
+            (grabbed, frame) = self.grab()
+            
+            if grabbed:
+                failures = 0
+                self.publish(frame)
+                continue
             
-            # Read frame from camera
-            (self.grabbed, self.frame) = self.stream.read()
+            self.grabbed = False
+            self.read_failures += 1
+            failures += 1
+            silent = time.monotonic() - self.last_frame_monotonic
+            if self.reconnect and (failures >= 30 or silent > self.stall_timeout):
+                failures = 0
+                (grabbed, frame) = self.reopen()
+                if grabbed:
+                    self.publish(frame)
+            else:
+                # Avoid spinning while the device has nothing to give
+                self.idle(0.01 if failures < 30 else 0.5)
+    
+    def idle(self, seconds):
+        """Sleep, waking early if the stream is stopped"""
+        with self.frame_ready:
+            self.frame_ready.wait_for(lambda: self.stopped, seconds)
+    
+    def reopen(self):
+        """Release the device and open it again, backing off exponentially: (grabbed, frame)"""
+        self.reconnecting = True
+        print(f"⚠️  Camera {self.src} stopped delivering frames - reconnecting")
+        delay = 0.5
+        attempts = 0
+        try:
+            while not self.stopped:
+                attempts += 1
+                self.reconnect_attempts += 1
+                self.stream.release()
+                try:
+                    self.open_device()
+                    (grabbed, frame) = self.warm_up()
+                except cv2.error as e:
+                    (grabbed, frame) = (False, None)
+                    self.last_error = str(e)
+                else:
+                    if not grabbed:
+                        self.last_error = f"No frames from {self.src}"
+                if grabbed:
+                    self.reconnects += 1
+                    print(f"✅ Camera {self.src} reconnected after {attempts} attempt(s)")
+                    return grabbed, frame
+                self.next_retry = time.monotonic() + delay
+                print(f"🔌 Camera {self.src} unavailable - retrying in {delay:.1f}s")
+                self.idle(delay)
+                delay = min(delay * 2, self.max_backoff)
+            return False, None
+        finally:
+            self.reconnecting = False
+    
+    def grab(self):
+        """Read the next frame from the source into a pooled buffer: (grabbed, frame)"""
+        if self.realtime:
+            self.pace()
+        if self.requested_size is not None:
+            self.apply_requested_size()
+        # Passthrough JPEGs vary in length, so only decoded frames are pooled
+        buffer = self.pool.take(getattr(self.frame, 'shape', None)) if self.format == 'bgr' else None
+        (grabbed, frame) = self.stream.read(buffer)
+        if not grabbed and self.loop:
+            self.stream.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            (grabbed, frame) = self.stream.read(buffer)
+        if not grabbed and buffer is not None:
+            self.pool.give(buffer)
+        return grabbed, frame
+    
+    def pace(self):
+        """Sleep until the next frame is due at the target FPS"""
+        now = time.monotonic()
+        if self.next_due > now:
+            time.sleep(self.next_due - now)
+        self.next_due = max(now, self.next_due) + 1.0 / self.fps
+    
+    def publish(self, frame):
+        """Publish a new frame and wake every waiting consumer"""
+        with self.frame_ready:
+            previous = self.frame
+            now = time.time()
+            gap = time.monotonic() - self.last_frame_monotonic
+            self.last_frame_monotonic += gap
+            if self.seq and gap > self.stall_timeout:
+                self.stalls += 1
+                self.last_stall_seconds = gap
+                self.stall_seconds += gap
+            if self.timestamp:
+                interval = now - self.timestamp
+                self.frame_interval = interval if not self.frame_interval else (
+                    0.9 * self.frame_interval + 0.1 * interval)
+            self.grabbed = True
+            self.frame = frame
+            self.seq += 1
+            self.timestamp = now
+            self.frame_ready.notify_all()
             
-            # Small delay to prevent excessive CPU usage
-            time.sleep(0.001)  # 1ms delay
+            # Recycle the replaced frame unless a reader may still use it
+            if previous is not None and previous is not frame:
+                entry = self.borrowed.get(id(previous))
+                if entry is not None:
+                    entry[2] = entry[2] and not self.shared
+                elif not self.shared:
+                    self.pool.give(previous)
+            self.shared = False
+            for _ in self.consumers:
+                self.lend(frame)
+            seq, timestamp = self.seq, self.timestamp
+        
+        # Outside the lock: a BLOCK-policy queue may hold the capture thread here
+        for queue in self.consumers:
+            queue.put((seq, timestamp, frame))
+    
+    def lend(self, frame):
+        """Count a borrower of frame (call with frame_ready held)"""
+        entry = self.borrowed.setdefault(id(frame), [frame, 0, True])
+        entry[1] += 1
     
     def read(self):
         """Return the current frame"""
-        return self.frame
+        with self.frame_ready:
+            self.shared = True
+            return self.frame
+    
+    def read_latest(self):
+        """Return (seq, timestamp, frame) for the most recent frame"""
+        with self.frame_ready:
+            self.shared = True
+            return self.seq, self.timestamp, self.frame
+    
+    def wait_for_frame(self, last_seq=0, timeout=None, borrow=False):
+        """
+        Block until a frame newer than last_seq is captured
+        Args:
+            last_seq: Sequence number of the last frame the caller consumed
+            timeout: Maximum seconds to wait (None waits forever)
+            borrow: Lend the pooled buffer without copying; the caller must
+                not modify it and must hand it back with release()
+        Returns:
+            (seq, timestamp, frame) tuple, or None on timeout or stop
+        """
+        with self.frame_ready:
+            self.frame_ready.wait_for(
+                lambda: self.stopped or self.seq > last_seq, timeout)
+            if self.stopped or self.seq <= last_seq:
+                return None
+            if borrow:
+                self.lend(self.frame)
+            else:
+                self.shared = True
+            return self.seq, self.timestamp, self.frame
+    
+    def release(self, frame):
+        """Hand back a frame borrowed from wait_for_frame() or a consumer queue"""
+        with self.frame_ready:
+            entry = self.borrowed.get(id(frame))
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self.borrowed[id(frame)]
+            if frame is not self.frame and entry[2]:
+                self.pool.give(frame)
     
     def stop(self):
         """Stop the video stream"""
         self.stopped = True
-        if self.stream.isOpened():
+        with self.frame_ready:
+            self.frame_ready.notify_all()
+        # Let the capture thread leave read() before releasing the device
+        thread = getattr(self, 'thread', None)
+        if thread is not None and thread.is_alive():
+            thread.join(timeout=2.0)
+        if self.stream is not None and self.stream.isOpened():
             self.stream.release()
         print("🛑 Video stream stopped")
+
+class SyntheticStream(VideoStream):
+    def __init__(self, width=1280, height=720, fps=30, weevils=3, seed=0):
+        """
+        Camera-free source producing textured frames with moving dark blobs
+        Args:
+            width, height: Frame size
+            fps: Frames per second (0 = as fast as possible)
+            weevils: Number of moving blobs drawn on each frame
+            seed: Random seed so benchmark runs are reproducible
+        """
+        self.stream = None
+        self.fps = fps
+        self.realtime = fps > 0
+        self.loop = False
+        self.frame_ready = Condition()
+        self.seq = 0
+        self.timestamp = 0.0
+        self.next_due = 0.0
+        self.frame_interval = 0.0
+        self.init_pool(4)
+        self.init_watchdog(False, 5.0, 30.0)
+        self.format = 'bgr'
+        self.requested_size = None
+        self.grabbed = False
+        self.frame = None
+        self.stopped = False
+        
+        rng = np.random.default_rng(seed)
+        noise = rng.integers(0, 40, (height // 8, width // 8, 3), dtype=np.uint8)
+        self.background = cv2.resize(noise, (width, height), interpolation=cv2.INTER_LINEAR) + 60
+        self.positions = rng.uniform((0, 0), (width, height), (weevils, 2))
+        self.velocities = rng.uniform(-4, 4, (weevils, 2))
+        self.size = (width, height)
+        self.max_size = self.size
+        print(f"📹 Synthetic camera initialized: {width}x{height} @ {fps} FPS")
+    
+    def negotiated(self):
+        width, height = self.size
+        return {'backend': 'synthetic', 'fourcc': 'BGR3', 'width': width, 'height': height, 'fps': self.fps}
+    
+    def is_opened(self):
+        return True
+    
+    def request_width(self, width):
+        pass  # Fixed size
+    
+    def grab(self):
+        if self.realtime:
+            self.pace()
+        width, height = self.size
+        self.positions = (self.positions + self.velocities) % (width, height)
+        frame = self.pool.take(self.background.shape)
+        if frame is None:
+            frame = np.empty_like(self.background)
+        np.copyto(frame, self.background)
+        for x, y in self.positions.astype(int):
+            cv2.ellipse(frame, (x, y), (18, 9), 30, 0, 360, (20, 20, 110), -1)
+        return True, frame
+
+def open_stream(src, fps=30, loop=None, realtime=None, **capture):
+    """
+    Open a capture source
+    
+    "synthetic://WIDTHxHEIGHT@FPS" (all parts optional) gives a camera-free
+    SyntheticStream; anything else is handed to VideoStream along with the
+    capture options (backend, fourcc, width, height, passthrough,
+    stall_timeout, max_backoff). Local video files loop and play at their
+    target FPS unless told otherwise; everything else is reopened by the
+    watchdog when it stops delivering frames.
+    """
+    is_file = isinstance(src, str) and os.path.isfile(src)
+    loop = is_file if loop is None else loop
+    realtime = is_file if realtime is None else realtime
+    if isinstance(src, str) and src.startswith('synthetic://'):
+        spec = src[len('synthetic://'):]
+        size, _, rate = spec.partition('@')
+        width, _, height = size.partition('x')
+        return SyntheticStream(int(width or 1280), int(height or 720),
+                               int(rate) if rate else fps)
+    return VideoStream(src=src, fps=fps, loop=loop, realtime=realtime,
+                       reconnect=not is_file, **capture)